@@ -1,8 +1,16 @@
 """Meshcore Analyzer — анализатор пакетов MeshCore Observer.
 
-Version: 3.8
+Version: 3.9
 
 Changelog:
+  v3.9 — Производительность разбора и вывода
+    - AES для каналов через cryptography (OpenSSL, AES-NI); pycryptodome
+      остаётся запасным вариантом, если cryptography не установлен
+    - meshcore-stats.json через orjson (если установлен), запись атомарная
+      (временный файл + os.replace)
+    - --max-nodes N: предел узлов и соседей в статистике, сверх него
+      вытесняются наименее активные (по умолчанию 0 — без предела)
+    - Цвета только в терминале: при выводе в файл/pipe или с NO_COLOR — без ANSI
   v3.8 — Исходящие соседи из path любого FLOOD-пакета (не только ботов)
     - Добавлен path-based анализ исходящих соседей: для любого FLOOD,
       в пути которого встречается мой репитер на ЛЮБОЙ позиции (originator,
@@ -185,7 +193,7 @@ Changelog:
     - Парсинг RAW-пакетов MeshCore v1
 """
 
-__version__ = '3.7'
+__version__ = '3.9'
 
 import serial
 import time
@@ -193,37 +201,75 @@ import sys
 import os
 import re
 import json
+import struct
 import argparse
+import functools
 import hashlib
+import importlib.util
 import hmac
 import base64
 import threading
-import queue
-import urllib.request
+import heapq
 from collections import defaultdict
 from collections import deque
-
+from collections import OrderedDict
+from collections import Counter
+from operator import itemgetter
+
+# AES-128-ECB для расшифровки каналов: предпочитаем cryptography (OpenSSL,
+# аппаратный AES-NI), pycryptodome — запасной вариант. Здесь только проверяем
+# наличие пакета; сам импорт — при первой расшифровке (_aes_ecb_decrypt),
+# чтобы не тратить время запуска в режимах без каналов (только API).
+if importlib.util.find_spec('cryptography') is not None:
+    CRYPTO_BACKEND = 'cryptography'
+elif importlib.util.find_spec('Crypto') is not None:
+    CRYPTO_BACKEND = 'pycryptodome'
+else:
+    CRYPTO_BACKEND = None
+HAS_CRYPTO = CRYPTO_BACKEND is not None
+
+# paho-mqtt нужен только с --mqtt: импортируется в _mqtt_thread.
+# find_spec для 'paho.mqtt.client' импортирует родительский пакет и без paho
+# падает с ModuleNotFoundError — поэтому сначала проверяем сам 'paho'.
 try:
-    from Crypto.Cipher import AES
-    HAS_CRYPTO = True
-except ImportError:
-    HAS_CRYPTO = False
+    HAS_MQTT = (importlib.util.find_spec('paho') is not None
+                and importlib.util.find_spec('paho.mqtt.client') is not None)
+except ModuleNotFoundError:
+    HAS_MQTT = False
+
+# pyudev (опционально, только Linux): ожидание USB-порта по событиям udev
+# вместо периодической проверки. Импортируется в _wait_for_port.
+HAS_PYUDEV = sys.platform.startswith('linux') and importlib.util.find_spec('pyudev') is not None
 
+# orjson (опционально) — в разы быстрее stdlib json на файле статистики,
+# ответах API и JSON из MQTT.
 try:
-    import paho.mqtt.client as mqtt
-    HAS_MQTT = True
+    import orjson
+    HAS_ORJSON = True
 except ImportError:
-    HAS_MQTT = False
+    HAS_ORJSON = False
+
+
+def _json_dumps(obj) -> bytes:
+    """Сериализует в компактный UTF-8 JSON без отступов (orjson, если установлен)."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+_json_loads = orjson.loads if HAS_ORJSON else json.loads
 
 # ========== ANSI-коды цветов для терминального вывода ==========
-GREEN = '\033[92m'
-CYAN = '\033[96m'
-YELLOW = '\033[93m'
-RED = '\033[91m'
-MAGENTA = '\033[95m'
-BLUE = '\033[94m'
-RESET = '\033[0m'
-BOLD = '\033[1m'
+# Вывод в файл/pipe (systemd, grep) или NO_COLOR — без escape-последовательностей.
+_COLOR = sys.stdout.isatty() and 'NO_COLOR' not in os.environ
+GREEN = '\033[92m' if _COLOR else ''
+CYAN = '\033[96m' if _COLOR else ''
+YELLOW = '\033[93m' if _COLOR else ''
+RED = '\033[91m' if _COLOR else ''
+MAGENTA = '\033[95m' if _COLOR else ''
+BLUE = '\033[94m' if _COLOR else ''
+RESET = '\033[0m' if _COLOR else ''
+BOLD = '\033[1m' if _COLOR else ''
 # ===============================================================
 
 
@@ -248,7 +294,7 @@ def is_my_repeater(token: str) -> bool:
     t = token.upper()
     n = len(t)
     if n in (2, 4, 6):
-        return any(rep[:n] == t for rep in MY_REPEATERS_HEX)
+        return t in _MY_REPEATER_PREFIXES[n]
     return any(rep.startswith(t) or t.startswith(rep) for rep in MY_REPEATERS_HEX)
 
 
@@ -320,13 +366,16 @@ def _outgoing_neighbors_from_path(hops):
         return out
 
     # 2B/3B: сканируем весь path, фиксируем все my→чужой переходы.
+    # Принадлежность каждого хопа вычисляем один раз, а не при каждом проходе.
+    mine = [is_my_repeater(h) for h in hops]
+    n = len(hops)
     i = 0
-    while i < len(hops):
-        if is_my_repeater(hops[i]):
-            j = i
-            while j < len(hops) and is_my_repeater(hops[j]):
+    while i < n:
+        if mine[i]:
+            j = i + 1
+            while j < n and mine[j]:
                 j += 1
-            if j < len(hops):
+            if j < n:
                 nb = hops[j]
                 if nb not in seen:
                     seen.add(nb)
@@ -357,7 +406,7 @@ _usb_hash_to_line_prev = {}
 # чтобы для "только USB" можно было увидеть сырой hex и path конкретного hash.
 _usb_hash_to_raw_curr = {}
 _usb_hash_to_raw_prev = {}
-_recent_raw_usb = deque(maxlen=50)  # элементы: {'payload_type','route_char','payload_len','hex','path'}
+_recent_raw_usb = deque(maxlen=50)  # элементы: (payload_type, route_char, payload_len, hex, path); только при -d
 
 # Накопительный счётчик пакетов, которые увидели по USB, но не увидели в API.
 _usb_only_total = 0
@@ -383,6 +432,21 @@ NODE_PREFIX = '10'
 # Подсвечиваются голубым в таблицах. Можно переопределить через --repeaters.
 MY_REPEATERS_HEX = ['333333', '343434']
 
+# Префиксы адресов репитеров по длине токена (2/4/6 hex) для is_my_repeater:
+# одна проверка по множеству вместо перебора MY_REPEATERS_HEX на каждый хоп.
+_MY_REPEATER_PREFIXES = {}
+
+
+def _rebuild_repeater_prefixes():
+    """Пересобирает _MY_REPEATER_PREFIXES (при смене MY_REPEATERS_HEX)."""
+    global _MY_REPEATER_PREFIXES
+    _MY_REPEATER_PREFIXES = {
+        n: frozenset(rep[:n] for rep in MY_REPEATERS_HEX) for n in (2, 4, 6)
+    }
+
+
+_rebuild_repeater_prefixes()
+
 # Байт на хоп в маршруте (1 — старые прошивки; 2/3 — Meshcore 1.14+).
 # В логах Observer путь приходит как последовательность байт; адрес ретранслятора
 # занимает 1/2/3 байта в зависимости от прошивки. Принадлежность токена вашему
@@ -471,6 +535,11 @@ ROUTE_TYPES = {
     0x02: 'DIRECT',
     0x03: 'T_DIRECT',
 }
+
+# Те же имена списками по уже замаскированному значению поля заголовка
+# (payload type — 4 бита, route type — 2 бита): индекс вместо dict.get.
+PAYLOAD_TYPE_NAMES = [PAYLOAD_TYPES.get(_i, f'?{_i}') for _i in range(16)]
+ROUTE_TYPE_NAMES = [ROUTE_TYPES[_i] for _i in range(4)]
 # ========================================
 
 # Общий PSK канала Public (как в examples companion_radio / simple_secure_chat).
@@ -481,19 +550,45 @@ PUBLIC_GROUP_PSK_B64 = 'izOH6cXN6mrJ5e26oRXNcg=='
 # При коллизиях хешей пробуем все варианты.
 # Структура: channel_hash -> [(имя, AES-ключ 16 байт), ...]
 CHANNEL_KEYS = {}
-for _ch_name in KNOWN_CHANNEL_NAMES:
-    _key = hashlib.sha256(_ch_name.encode()).digest()[:16]
-    _ch_hash = hashlib.sha256(_key).digest()[0]
-    CHANNEL_KEYS.setdefault(_ch_hash, []).append((_ch_name, _key))
+
+# Плоская таблица channel_hash -> ((имя, ключ), ...) для горячего пути:
+# индекс по байту хеша вместо словаря, пустой кортеж — «нет канала».
+CHANNEL_KEYS_TABLE = [()] * 256
+
+# Битовая маска известных хешей каналов (именованных и PSK): бит h = 1, если
+# для channel_hash h есть ключ. Проверка (mask >> h) & 1 отсекает чужие каналы.
+CHANNEL_HASH_MASK = 0
+
+
+def _derive_channel_key(name: str) -> tuple[int, bytes]:
+    """Имя канала -> (channel_hash, AES-ключ 16 байт)."""
+    key = hashlib.sha256(name.encode()).digest()[:16]
+    return hashlib.sha256(key).digest()[0], key
+
+
+def _register_named_channel(name: str) -> None:
+    """Добавляет именованный канал в CHANNEL_KEYS и CHANNEL_KEYS_TABLE."""
+    global CHANNEL_HASH_MASK
+    ch_h, key = _derive_channel_key(name)
+    CHANNEL_KEYS.setdefault(ch_h, []).append((name, key))
+    CHANNEL_KEYS_TABLE[ch_h] = tuple(CHANNEL_KEYS[ch_h])
+    CHANNEL_HASH_MASK |= 1 << ch_h
+
+
+for _ch_name in dict.fromkeys(KNOWN_CHANNEL_NAMES):
+    _register_named_channel(_ch_name)
 
 # Каналы с PSK (MeshCore v1: encryptThenMAC / MACThenDecrypt).
 # secret на wire: 16 или 32 байта PSK, в HMAC ключ дополняется нулями до 32 байт.
 # channel.hash[0] = SHA256(PSK)[0] (длина 16 или 32 как при addChannel).
 # Структура: channel_hash -> [(имя, secret32), ...]
 CHANNEL_PSK = {}
+# То же плоской таблицей по байту хеша (как CHANNEL_KEYS_TABLE).
+CHANNEL_PSK_TABLE = [()] * 256
 
 
 def _register_psk_channel(name: str, psk_b64: str) -> None:
+    global CHANNEL_HASH_MASK
     raw = base64.b64decode(psk_b64)
     if len(raw) not in (16, 32):
         return
@@ -502,48 +597,126 @@ def _register_psk_channel(name: str, psk_b64: str) -> None:
     sec32 = bytes(sec32)
     ch_h = hashlib.sha256(raw).digest()[0]
     CHANNEL_PSK.setdefault(ch_h, []).append((name, sec32))
+    CHANNEL_PSK_TABLE[ch_h] = tuple(CHANNEL_PSK[ch_h])
+    CHANNEL_HASH_MASK |= 1 << ch_h
 
 
 _register_psk_channel('Public', PUBLIC_GROUP_PSK_B64)
 # ====================================
 
+class NodeStat:
+    """Счётчики одного узла в stats.
+
+    __slots__ вместо dict на узел: меньше памяти, поле — смещение в объекте,
+    а не поиск по хешу. В meshcore-stats.json пишется как dict (to_dict).
+    """
+    __slots__ = ('rx', 'tx', 'errors', 'snr_sum', 'snr_count',
+                 'rssi_sum', 'rssi_count', 'hops_seen')
+
+    def __init__(self):
+        self.rx = 0          # Количество принятых пакетов (RX)
+        self.tx = 0          # Количество отправленных пакетов (TX)
+        self.errors = 0      # Количество пакетов с score=0 (ошибочных)
+        self.snr_sum = 0     # Сумма SNR для расчёта среднего
+        self.snr_count = 0   # Количество замеров SNR
+        self.rssi_sum = 0    # Сумма RSSI для расчёта среднего
+        self.rssi_count = 0  # Количество замеров RSSI
+        self.hops_seen = 0   # Сколько раз узел встречался хопом в path (U RAW / MQTT)
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class NeighborStat:
+    """Счётчики одного соседа в neighbor_stats (см. NodeStat)."""
+    __slots__ = ('total', 'snr_sum', 'snr_count',
+                 'trace_out_sum', 'trace_out_count',
+                 'trace_in_sum', 'trace_in_count',
+                 'trace_attempts', 'trace_ok')
+
+    def __init__(self):
+        self.total = 0
+        self.snr_sum = 0          # SNR при приёме observer (из RX-строки)
+        self.snr_count = 0
+        self.trace_out_sum = 0    # SNR→ (репитер → сосед, из TRACE)
+        self.trace_out_count = 0
+        self.trace_in_sum = 0     # SNR← (сосед → репитер, из TRACE)
+        self.trace_in_count = 0
+        self.trace_attempts = 0   # Попыток трассировки
+        self.trace_ok = 0         # Успешных (полный ответ)
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
 # Глобальный словарь статистики по каждому узлу.
-# Ключ — адрес узла (строка), значение — dict со счётчиками.
-stats = defaultdict(lambda: {
-    'rx': 0,          # Количество принятых пакетов (RX)
-    'tx': 0,          # Количество отправленных пакетов (TX)
-    'errors': 0,      # Количество пакетов с score=0 (ошибочных)
-    'snr_sum': 0,     # Сумма SNR для расчёта среднего
-    'snr_count': 0,   # Количество замеров SNR
-    'rssi_sum': 0,    # Сумма RSSI для расчёта среднего
-    'rssi_count': 0,  # Количество замеров RSSI
-})
+# Ключ — адрес узла (строка), значение — NodeStat со счётчиками.
+stats = defaultdict(NodeStat)
 
 # Статистика соседей: кто доставляет пакеты ретранслятору и наблюдателю.
-neighbor_stats = defaultdict(lambda: {
-    'total': 0,
-    'snr_sum': 0,          # SNR при приёме observer (из RX-строки)
-    'snr_count': 0,
-    'trace_out_sum': 0,    # SNR→ (репитер → сосед, из TRACE)
-    'trace_out_count': 0,
-    'trace_in_sum': 0,     # SNR← (сосед → репитер, из TRACE)
-    'trace_in_count': 0,
-    'trace_attempts': 0,   # Попыток трассировки
-    'trace_ok': 0,         # Успешных (полный ответ)
-})
+neighbor_stats = defaultdict(NeighborStat)
+
+# Предел числа узлов в stats и соседей в neighbor_stats (--max-nodes; по
+# умолчанию 0 — без предела). За дни работы таблицы копят разовые узлы;
+# с заданным пределом в конце цикла вытесняются наименее активные.
+MAX_NODES = 0
+
+
+def _node_activity(rec: NodeStat) -> int:
+    return rec.rx + rec.tx + rec.hops_seen
+
+
+def _neighbor_activity(rec: NeighborStat) -> int:
+    return rec.total
+
+
+def prune_stats() -> None:
+    """Урезает stats и neighbor_stats до MAX_NODES, удаляя наименее активные записи.
+
+    BROADCAST-строку не трогаем: это сводка, а не узел.
+    """
+    if MAX_NODES <= 0:
+        return
+    for table, activity in ((stats, _node_activity), (neighbor_stats, _neighbor_activity)):
+        excess = len(table) - MAX_NODES
+        if excess <= 0:
+            continue
+        victims = heapq.nsmallest(
+            excess,
+            (node for node in list(table) if node != BROADCAST_NODE),
+            key=lambda node: activity(table[node]),
+        )
+        for node in victims:
+            del table[node]
+
 
 # Статистика исходящих соседей (из расшифрованных групповых сообщений с path).
-outgoing_stats = defaultdict(lambda: {'total': 0})
+# Единственный счётчик на соседа — число пакетов: Counter сосед -> total.
+# В meshcore-stats.json сохраняется прежним видом {сосед: {'total': n}}.
+outgoing_stats = Counter()
 
 # Последний определённый сосед из RAW-пакета (для корреляции с SNR из RX-строки)
 _last_raw_neighbor = None
 
+# Предел для множеств дедупликации ниже: сверх него вытесняются самые
+# давние ключи (по одному), а не сбрасывается всё множество сразу — иначе
+# сразу после сброса повторы того же пакета снова попадали бы в счётчики.
+SEEN_MAX = 4096
+
+
+def _lru_add(seen: OrderedDict, key, limit: int) -> None:
+    """Добавляет key в OrderedDict-множество; сверх limit вытесняет самый давний."""
+    seen[key] = None
+    if len(seen) > limit:
+        seen.popitem(last=False)
+
+
 # Множества trace_tag, по которым уже инкрементировали соответствующие
 # счётчики (наблюдатель часто видит один и тот же ответ несколько раз
-# из-за эхо/повторов). Ограничиваем размер, чтобы не утекать память.
-_trace_attempts_seen = set()
-_trace_out_seen = set()
-_trace_in_seen = set()
+# из-за эхо/повторов). Размер ограничен SEEN_MAX.
+_trace_attempts_seen = OrderedDict()
+_trace_out_seen = OrderedDict()
+_trace_in_seen = OrderedDict()
 
 # Дедуп исходящих соседей: ключ = (sha256(payload)[:8], neighbor_hex).
 # Один логический пакет наблюдатель видит несколько раз с разными path —
@@ -552,23 +725,21 @@ _trace_in_seen = set()
 # path=[3333,5086,...]), даёт +1 каждому — это разные пути распространения.
 # Используется и для bot-text extraction, и для path-based extraction
 # (см. _record_outgoing).
-_outgoing_seen = set()
+_outgoing_seen = OrderedDict()
 
 
 def _record_outgoing(payload_hash: bytes, neighbor: str) -> bool:
     """Регистрирует наблюдение пары (payload, neighbor) в outgoing_stats.
 
     Возвращает True при первом наблюдении пары (и инкрементирует статистику),
-    False — если эту пару уже видели (счётчик не трогаем). Лёгкая защита
-    от утечки памяти: при росте >4096 сбрасываем множество.
+    False — если эту пару уже видели (счётчик не трогаем). Помним не больше
+    SEEN_MAX последних пар.
     """
     key = (payload_hash, neighbor)
     if key in _outgoing_seen:
         return False
-    _outgoing_seen.add(key)
-    if len(_outgoing_seen) > 4096:
-        _outgoing_seen.clear()
-    outgoing_stats[neighbor]['total'] += 1
+    _lru_add(_outgoing_seen, key, SEEN_MAX)
+    outgoing_stats[neighbor] += 1
     return True
 
 # Рекорды максимального числа хопов отдельно по 1B/2B/3B.
@@ -580,10 +751,22 @@ STATS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'meshcore-
 # API MeshCoreTel для получения пакетов от всех наблюдателей региона
 MESHCORETEL_API = 'https://meshcoretel.ru/api/packets'
 
+# Опрос API: размер страницы и число страниц за один опрос
+API_PAGE_LIMIT = 500
+API_MAX_PAGES = 5
+# Интервал опроса (сек): базовый и пределы адаптации по потоку пакетов
+API_POLL_INTERVAL = 15
+API_POLL_MIN = 3
+API_POLL_MAX = 60
+
 # ID последнего обработанного пакета из API (для инкрементальных запросов)
 _api_last_id = None
-# Множество обработанных хешей пакетов (дедупликация: один пакет виден многим наблюдателям)
-_api_seen_hashes = set()
+# Сколько пакетов вернул последний опрос API (для адаптивного интервала)
+_api_last_fetched = 0
+# Обработанные хеши пакетов (дедупликация: один пакет виден многим наблюдателям).
+# OrderedDict как LRU: при переполнении вытесняются самые давние хеши.
+API_SEEN_MAX = 50000
+_api_seen_hashes = OrderedDict()
 
 # Счётчик залогированных сырых MQTT-сообщений (для вывода образцов формата).
 _mqtt_samples_logged = 0
@@ -591,28 +774,94 @@ _mqtt_samples_logged = 0
 _mqtt_messages_received = 0
 
 
-def save_stats():
-    """Сохраняет накопленную статистику в JSON-файл."""
-    data = {
-        'stats': dict(stats),
-        'neighbor_stats': dict(neighbor_stats),
-        'outgoing_stats': dict(outgoing_stats),
-        'max_hops_by_bph': {},
-    }
-    # Отдельные рекорды по 1B/2B/3B
-    try:
-        for bph, rec in max_hops_by_bph.items():
-            if not rec:
+# Последнее записанное содержимое meshcore-stats.json: без изменений файл не переписываем.
+_last_saved_blob = None
+
+# Запись файла статистики вынесена в фоновый поток: сериализация (снимок)
+# делается в вызывающем потоке, на диск blob пишет _stats_saver.
+# _save_lock защищает _pending_blob, _last_saved_blob и саму запись: более
+# старый blob никогда не перезапишет более новый.
+_save_lock = threading.Lock()
+_save_event = threading.Event()
+_pending_blob = None
+_saver_thread = None
+
+
+def _write_stats_blob(blob: bytes) -> None:
+    """Пишет blob во временный файл и атомарно подменяет STATS_FILE.
+
+    При обрыве питания не останется наполовину записанного meshcore-stats.json.
+    Вызывается под _save_lock; _last_saved_blob меняется только после записи.
+    """
+    global _last_saved_blob
+    tmp_file = STATS_FILE + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(blob)
+    os.replace(tmp_file, STATS_FILE)
+    _last_saved_blob = blob
+
+
+def _stats_saver():
+    """Фоновый поток: пишет последний поставленный в очередь снимок статистики."""
+    global _pending_blob
+    while True:
+        _save_event.wait()
+        _save_event.clear()
+        with _save_lock:
+            blob, _pending_blob = _pending_blob, None
+            if blob is None:
                 continue
-            r = dict(rec)
-            if isinstance(r.get('payload'), (bytes, bytearray)):
-                r['payload'] = r['payload'].hex()
-            data['max_hops_by_bph'][str(bph)] = r
-    except Exception:
-        pass
+            try:
+                _write_stats_blob(blob)
+            except Exception as e:
+                # _last_saved_blob не изменился — повторим при следующем сохранении
+                print(f"{YELLOW}Ошибка сохранения статистики: {e}{RESET}")
+
+
+def save_stats(sync=False):
+    """Сохраняет накопленную статистику в JSON-файл (если она изменилась).
+
+    Снимок (JSON) строится сразу, а запись на диск по умолчанию уходит в
+    фоновый поток, чтобы не задерживать цикл разбора. sync=True — записать
+    немедленно (при завершении программы).
+    """
+    global _pending_blob, _saver_thread
     try:
-        with open(STATS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # Таблицы пополняются из потоков MQTT и опроса API: сначала снимаем
+        # копии list(...), иначе вставка во время обхода даст RuntimeError.
+        data = {
+            'stats': {node: rec.to_dict() for node, rec in list(stats.items())},
+            'neighbor_stats': {nb: rec.to_dict() for nb, rec in list(neighbor_stats.items())},
+            'outgoing_stats': {nb: {'total': n} for nb, n in list(outgoing_stats.items())},
+            'max_hops_by_bph': {},
+        }
+        # Отдельные рекорды по 1B/2B/3B
+        try:
+            for bph, rec in list(max_hops_by_bph.items()):
+                if not rec:
+                    continue
+                r = dict(rec)
+                if isinstance(r.get('payload'), (bytes, bytearray)):
+                    r['payload'] = r['payload'].hex()
+                data['max_hops_by_bph'][str(bph)] = r
+        except Exception:
+            pass
+        blob = _json_dumps(data)
+        # Под _save_lock фоновая запись уже завершена, а _last_saved_blob —
+        # то, что действительно лежит на диске. Ожидающий снимок старше
+        # текущего, поэтому в любом случае он больше не нужен.
+        with _save_lock:
+            _pending_blob = None
+            if blob == _last_saved_blob and os.path.exists(STATS_FILE):
+                return
+            if sync:
+                _write_stats_blob(blob)
+                return
+            _pending_blob = blob
+        if _saver_thread is None:
+            _saver_thread = threading.Thread(target=_stats_saver, daemon=True)
+            _saver_thread.start()
+        _save_event.set()
     except Exception as e:
         print(f"{YELLOW}Ошибка сохранения статистики: {e}{RESET}")
 
@@ -623,17 +872,17 @@ def load_stats():
     if not os.path.exists(STATS_FILE):
         return
     try:
-        with open(STATS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        for node, vals in data.get('stats', {}).items():
-            for k, v in vals.items():
-                stats[node][k] = v
-        for node, vals in data.get('neighbor_stats', {}).items():
-            for k, v in vals.items():
-                neighbor_stats[node][k] = v
+        with open(STATS_FILE, 'rb') as f:
+            data = _json_loads(f.read())
+        # Неизвестные поля (из других версий файла) пропускаем
+        for table, key in ((stats, 'stats'), (neighbor_stats, 'neighbor_stats')):
+            for node, vals in data.get(key, {}).items():
+                rec = table[node]
+                for k, v in vals.items():
+                    if k in rec.__slots__:
+                        setattr(rec, k, v)
         for node, vals in data.get('outgoing_stats', {}).items():
-            for k, v in vals.items():
-                outgoing_stats[node][k] = v
+            outgoing_stats[node] = vals.get('total', 0)
         max_hops_by_bph = {1: None, 2: None, 3: None}
         for k, rec in (data.get('max_hops_by_bph') or {}).items():
             try:
@@ -646,13 +895,32 @@ def load_stats():
                 rec = dict(rec)
                 rec['payload'] = bytes.fromhex(rec['payload'])
             max_hops_by_bph[bph] = rec
-        total_rx = sum(d['rx'] for d in stats.values())
+        total_rx = sum(d.rx for d in stats.values())
         print(f"Загружена статистика: {len(stats)} узлов, {total_rx} RX, "
               f"{len(neighbor_stats)} соседей, {len(outgoing_stats)} исх. соседей")
     except Exception as e:
         print(f"{YELLOW}Ошибка загрузки статистики: {e}{RESET}")
 
 
+# Регулярки для MQTT и шума эфира: компилируются один раз, а не на каждое сообщение.
+_RE_WHITESPACE = re.compile(r'\s+')
+_RE_PATH_SEP = re.compile(r'\s*->\s*|\s*,\s*')
+_RE_NON_HEX = re.compile(r'[^0-9A-Fa-f]')
+_RE_NOISE_FLOOR = re.compile(rb'noise_floor\s*=\s*(-?\d+)')  # по bytes, до декодирования
+
+# RX-строка одним поиском вместо цепочек split(): type, SNR, RSSI и (если
+# есть) пара [src->dst] из первых квадратных скобок после type=. Поля после
+# type= берутся опережающими проверками, так что порядок SNR и RSSI в строке
+# не важен. [^S]*(?:S(?!NR=)[^S]*)* — «всё до первого SNR=» без ленивого .*?
+# (тот пробует продолжение на каждом символе и заметно медленнее).
+_RE_RX = re.compile(
+    r'type=(\d+)'
+    r'(?=[^S]*(?:S(?!NR=)[^S]*)*SNR=(-?[\d.]+))'
+    r'(?=[^R]*(?:R(?!SSI=)[^R]*)*RSSI=(-?\d+))'
+    r'(?:(?=[^\[]*\[([^\]>]*)->([^\]]*)\]))?'
+)
+
+
 def _process_mqtt_payload(topic, payload_bytes):
     """Обрабатывает одно MQTT-сообщение: логирует сырой формат и обновляет статистику.
 
@@ -678,16 +946,16 @@ def _process_mqtt_payload(topic, payload_bytes):
             except Exception:
                 pass
 
-    # Пробуем JSON
+    # Пробуем JSON (JSONDecodeError и json, и orjson — подклассы ValueError)
     try:
-        data = json.loads(payload)
-    except (json.JSONDecodeError, TypeError):
+        data = _json_loads(payload)
+    except (ValueError, TypeError):
         data = None
 
     if isinstance(data, dict):
         # JSON наблюдателя / meshcoretomqtt: полное RAW — тот же разбор, что U RAW: (GRP, рекорды хопов).
         if isinstance(data.get('raw'), str):
-            raw_hex = re.sub(r'\s+', '', data['raw'])
+            raw_hex = _RE_WHITESPACE.sub('', data['raw'])
             parsed = parse_raw(raw_hex)
             if parsed:
                 pkt_time = (f"{data.get('date', '')} {data.get('time', '')}".strip()
@@ -707,14 +975,14 @@ def _process_mqtt_payload(topic, payload_bytes):
         # Формат meshcoretomqtt только с path (без полного raw в сообщении)
         path = data.get('path') or data.get('path_hops')
         if isinstance(path, str):
-            path = [x.strip().upper() for x in re.split(r'\s*->\s*|\s*,\s*', path) if x.strip()]
+            path = [x.strip().upper() for x in _RE_PATH_SEP.split(path) if x.strip()]
         if path and isinstance(path, (list, tuple)):
             hops = [str(h).strip().upper() for h in path]
             # Чистим всё, что не hex; оставляем длину как есть (2/4/6 hex = 1B/2B/3B
             # на хоп). is_my_repeater() умеет матчить любую из этих длин.
             path_norm = []
             for h in hops:
-                h = re.sub(r'[^0-9A-Fa-f]', '', h).upper()
+                h = _RE_NON_HEX.sub('', h).upper()
                 if not h:
                     continue
                 if len(h) == 1:
@@ -733,14 +1001,15 @@ def _process_mqtt_payload(topic, payload_bytes):
                     if not is_my_repeater(cand):
                         nb = cand
                 if nb:
-                    neighbor_stats[nb]['total'] += 1
+                    nbs = neighbor_stats[nb]
+                    nbs.total += 1
                     # meshcoretomqtt шлёт "SNR"/"RSSI" с большой буквы
                     snr = data.get('snr') or data.get('SNR')
                     if snr is not None:
                         try:
                             s = float(snr)
-                            neighbor_stats[nb]['snr_sum'] += s
-                            neighbor_stats[nb]['snr_count'] += 1
+                            nbs.snr_sum += s
+                            nbs.snr_count += 1
                         except (TypeError, ValueError):
                             pass
                 # Определяем bph по длине первого хопа (внутри одного пути
@@ -762,7 +1031,7 @@ def _process_mqtt_payload(topic, payload_bytes):
         return
 
     # Пробуем сырую hex-строку (как в U RAW)
-    raw_hex = re.sub(r'\s+', '', payload.strip())
+    raw_hex = _RE_WHITESPACE.sub('', payload.strip())
     if len(raw_hex) >= 10 and all(c in '0123456789abcdefABCDEF' for c in raw_hex):
         parsed = parse_raw(raw_hex)
         if parsed and parsed.get('path'):
@@ -778,7 +1047,7 @@ def _process_mqtt_payload(topic, payload_bytes):
                 else:
                     nb = last
                 if nb and not is_my_repeater(nb):
-                    neighbor_stats[nb]['total'] += 1
+                    neighbor_stats[nb].total += 1
                 hops = len(path)
                 bph = parsed.get('path_bytes_per_hop', 1)
                 if bph in (1, 2, 3):
@@ -796,6 +1065,74 @@ def _process_mqtt_payload(topic, payload_bytes):
                         }
 
 
+# Байт -> две заглавные hex-цифры: индекс вместо f"{b:02X}" на каждый хоп.
+_HEX_BYTE = tuple(f'{_i:02X}' for _i in range(256))
+
+
+# Вспомогательные функции parse_raw вынесены на уровень модуля: раньше они
+# заново создавались при каждом вызове (по одному на пакет).
+
+def _looks_like_group_payload(p: bytes) -> bool:
+    """Похож ли payload на GRP_TXT/GRP_DATA (для выбора интерпретации path_len)."""
+    if not p or len(p) < 4:
+        return False
+    # payload: [channel_hash:1][MAC:2][ciphertext]; ciphertext кратен 16
+    ct = p[3:]
+    if len(ct) == 0 or (len(ct) % 16) != 0:
+        return False
+    # Дополнительная эвристика: известный hash канала
+    if not CHANNEL_HASH_MASK:
+        return True
+    return bool((CHANNEL_HASH_MASK >> p[0]) & 1)
+
+
+def _decode_path(raw: bytes, bph: int) -> list[str]:
+    """Группирует raw_path в hex-хопы по bph байт."""
+    if bph == 1:
+        return [_HEX_BYTE[b] for b in raw]
+    # Один bytes.hex() на весь путь и нарезка строки; неполный хвост отбрасываем
+    step = bph * 2
+    h = raw.hex().upper()
+    return [h[i:i + step] for i in range(0, len(raw) // bph * step, step)]
+
+
+# Вариант B (1.14+): path_length упакован как mode+hops (Packet.cpp).
+# Стандарт: биты 7-6 = 0/1/2 → 1/2/3 байта на хоп, младшие 6 бит = число хопов
+# (32×2 B = 0x60). Proposal #1083 (v2): биты 7-6 = 0b11 → hop_count = max_base + ext,
+# max_base 63/31 для 1B/2B сегментов (напр. 0xD1 = 2B, 31+1 = 32 хопа).
+def _decode_mesh_packed_path_len(packed: int):
+    """Упакованный path_len -> (bph, hops, байт пути) или None, если невалиден."""
+    max_path = 64
+    upper = (packed >> 6) & 0x03
+    if upper != 0x03:
+        if upper > 2:
+            return None
+        bph = upper + 1
+        hops = packed & 0x3F
+        total = hops * bph
+        if total > max_path:
+            return None
+        return bph, hops, total
+    seg_code = (packed >> 4) & 0x03
+    ext = packed & 0x0F
+    if seg_code not in (0, 1):
+        return None
+    bph = 1 << seg_code
+    max_base = 63 if seg_code == 0 else 31
+    hops = max_base + ext
+    total = hops * bph
+    if total > max_path:
+        return None
+    return bph, hops, total
+
+
+# Заголовок payload DIRECT TRACE: tag(4) + auth(4) + flags(1), дальше маршрут.
+_TRACE_HDR = struct.Struct('<4s4sB')
+
+# Все 256 значений байта path_len заранее: в parse_raw — только индекс.
+_PACKED_PATH_LEN = tuple(_decode_mesh_packed_path_len(_i) for _i in range(256))
+
+
 def parse_raw(hex_str):
     """Парсит сырые hex-данные пакета MeshCore и извлекает заголовок, path и метаданные.
 
@@ -820,7 +1157,9 @@ def parse_raw(hex_str):
         dict с полями: route_type, payload_type, route_name, payload_name,
                        path_length (как в пакете: bytes или hops, см. ниже),
                        path_bytes_per_hop (1/2/3), path_hops, path (список хопов),
-                       payload (bytes), или None при ошибке
+                       payload (bytes), или None при ошибке.
+                       Для GRP_*, расшифрованных при выборе интерпретации path_len,
+                       дополнительно decrypted (результат decrypt_group_msg или None).
     """
     try:
         data = bytes.fromhex(hex_str)
@@ -846,26 +1185,6 @@ def parse_raw(hex_str):
         # В старых прошивках path_length — это число БАЙТ маршрута.
         # В 1.14+ path_length может быть упакованным (mode+hops). Авто-распознаём по эвристике.
 
-        def _looks_like_group_payload(p: bytes) -> bool:
-            if not p or len(p) < 4:
-                return False
-            # payload: [channel_hash:1][MAC:2][ciphertext]; ciphertext кратен 16
-            ct = p[3:]
-            if len(ct) == 0 or (len(ct) % 16) != 0:
-                return False
-            # Дополнительная эвристика: известный hash канала
-            known = set(CHANNEL_KEYS) | set(CHANNEL_PSK)
-            return (p[0] in known) if known else True
-
-        def _decode_path(raw: bytes, bph: int) -> list[str]:
-            out = []
-            for i in range(0, len(raw), bph):
-                chunk = raw[i:i + bph]
-                if len(chunk) != bph:
-                    break
-                out.append(chunk.hex().upper())
-            return out
-
         offset_after_len = offset
 
         # Вариант A (старый): path_length = bytes
@@ -878,36 +1197,9 @@ def parse_raw(hex_str):
             old_raw_path = b''
             old_payload = b''
 
-        # Вариант B (1.14+): path_length упакован как mode+hops (Packet.cpp).
-        # Стандарт: биты 7-6 = 0/1/2 → 1/2/3 байта на хоп, младшие 6 бит = число хопов
-        # (32×2 B = 0x60). Proposal #1083 (v2): биты 7-6 = 0b11 → hop_count = max_base + ext,
-        # max_base 63/31 для 1B/2B сегментов (напр. 0xD1 = 2B, 31+1 = 32 хопа).
-        def _decode_mesh_packed_path_len(packed: int):
-            max_path = 64
-            upper = (packed >> 6) & 0x03
-            if upper != 0x03:
-                if upper > 2:
-                    return None
-                bph = upper + 1
-                hops = packed & 0x3F
-                total = hops * bph
-                if total > max_path:
-                    return None
-                return bph, hops, total
-            seg_code = (packed >> 4) & 0x03
-            ext = packed & 0x0F
-            if seg_code not in (0, 1):
-                return None
-            bph = 1 << seg_code
-            max_base = 63 if seg_code == 0 else 31
-            hops = max_base + ext
-            total = hops * bph
-            if total > max_path:
-                return None
-            return bph, hops, total
-
-        packed = int(path_length)
-        dec = _decode_mesh_packed_path_len(packed)
+        # Вариант B (1.14+): path_length упакован как mode+hops (Packet.cpp),
+        # расшифровка байта — по таблице _PACKED_PATH_LEN.
+        dec = _PACKED_PATH_LEN[path_length]
         new_ok = dec is not None
         if new_ok:
             new_bph, new_hops, new_path_bytes_len = dec
@@ -923,6 +1215,11 @@ def parse_raw(hex_str):
             new_raw_path = b''
             new_payload = b''
 
+        # Результаты пробной расшифровки обоих вариантов (GRP_*): сохраняются в
+        # результат, чтобы _process_parsed_raw не расшифровывал payload ещё раз.
+        trial_decrypted = False
+        dec_new = dec_old = None
+
         # Выбор интерпретации
         # Если один из вариантов вообще невалиден — берём другой.
         if new_ok and not old_valid:
@@ -953,6 +1250,7 @@ def parse_raw(hex_str):
                     if HAS_CRYPTO:
                         dec_new = decrypt_group_msg(new_payload)
                         dec_old = decrypt_group_msg(old_payload)
+                        trial_decrypted = True
                         if dec_new and not dec_old:
                             use_new = True
                         elif dec_old and not dec_new:
@@ -996,7 +1294,7 @@ def parse_raw(hex_str):
                 payload = data[end_path:]
                 path_bytes_per_hop = 1
                 path_hops = n_snr
-                path = [f"{b:02X}" for b in raw_path]
+                path = [_HEX_BYTE[b] for b in raw_path]
 
         # Защита от явной аномалии: если после разбора 1B получилось слишком много хопов,
         # но длина пути кратна 2/3, это почти наверняка 2B/3B маршрут.
@@ -1028,13 +1326,12 @@ def parse_raw(hex_str):
         if payload_type == 0x09 and route_type in (0x02, 0x03):
             trace_snr = [(b - 256 if b > 127 else b) / 4.0 for b in raw_path]
             trace_route = []
-            if len(payload) >= 4:
-                # tag(4) — уникальный идентификатор трассы (для дедупа повторных
-                # наблюдений одного и того же ответа).
-                trace_tag = payload[0:4].hex().upper()
-            if len(payload) > 9:
-                path_sz = payload[8] & 0x03
-                route_bph = 1 << path_sz
+            # tag(4) — уникальный идентификатор трассы (для дедупа повторных
+            # наблюдений одного и того же ответа).
+            if len(payload) > _TRACE_HDR.size:
+                tag, _auth, trace_flags = _TRACE_HDR.unpack_from(payload)
+                trace_tag = tag.hex().upper()
+                route_bph = 1 << (trace_flags & 0x03)
                 if route_bph > 8:
                     route_bph = 8
                 raw_route = payload[9:]
@@ -1045,13 +1342,15 @@ def parse_raw(hex_str):
                             break
                         trace_route.append(chunk.hex().upper())
                 else:
-                    trace_route = [f"{b:02X}" for b in raw_route]
+                    trace_route = [_HEX_BYTE[b] for b in raw_route]
+            elif len(payload) >= 4:
+                trace_tag = payload[0:4].hex().upper()
 
-        return {
+        result = {
             'route_type': route_type,
             'payload_type': payload_type,
-            'route_name': ROUTE_TYPES.get(route_type, f'?{route_type}'),
-            'payload_name': PAYLOAD_TYPES.get(payload_type, f'?{payload_type}'),
+            'route_name': ROUTE_TYPE_NAMES[route_type],
+            'payload_name': PAYLOAD_TYPE_NAMES[payload_type],
             'path_length': path_length,
             'path_bytes_per_hop': path_bytes_per_hop,
             'path_hops': path_hops,
@@ -1062,6 +1361,9 @@ def parse_raw(hex_str):
             'trace_snr': trace_snr,
             'trace_tag': trace_tag,
         }
+        if trial_decrypted:
+            result['decrypted'] = dec_new if use_new else dec_old
+        return result
     except (ValueError, IndexError):
         return None
 
@@ -1082,32 +1384,67 @@ def send_cmd(ser, cmd, wait=0.5):
     time.sleep(wait)
 
 
-def read_until_eof(ser, timeout=10):
-    """Читает строки из серийного порта до маркера EOF или таймаута.
+def wait_ready(ser, timeout=2, accept=None):
+    """Ждёт от ноды строку-ответ после команды (проба готовности).
 
-    Нода Meshcore при команде "log" выводит накопленные логи и
-    завершает вывод строкой, содержащей 'EOF'. Функция построчно
-    собирает ответ до этого маркера.
+    Вместо фиксированных пауз после открытия порта: возвращается, как только
+    нода ответила (обычно за десятки-сотни мс), либо по таймауту. Строки,
+    которые accept() отвергает (загрузочный баннер и прочий шум), пропускаются.
 
-    Args:
-        ser: объект serial.Serial
-        timeout: максимальное время ожидания данных (сек)
+    Returns:
+        bytes: первая подходящая строка (без пробелов по краям) или b''
+    """
+    deadline = time.monotonic() + timeout
+    old_timeout = ser.timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return b''
+            ser.timeout = remaining
+            line = ser.readline().strip()
+            if line and (accept is None or accept(line)):
+                return line
+    finally:
+        ser.timeout = old_timeout
+
+
+# Проба "log start": сколько раз повторить команду и сколько ждать ответа
+READY_ATTEMPTS = 3
+READY_TIMEOUT = 1.5
+
+
+def _is_ready_reply(line: bytes) -> bool:
+    """Ответ CLI ("  -> ...", "OK") или уже строка лога — нода слушает."""
+    return (b'->' in line or b'OK' in line
+            or any(marker in line for marker in _LINE_HANDLERS))
+
+
+def start_logging(ser):
+    """Включает лог ноды: шлёт "log start", пока не придёт ответ или лог.
+
+    Сразу после открытия порта нода может ещё загружаться (баннер, сброс по
+    DTR) и пропустить команду, поэтому она повторяется до READY_ATTEMPTS раз.
 
     Returns:
-        list[str]: список прочитанных строк лога
+        bytes: строка-ответ (или первая строка лога) либо b'', если нода молчит
     """
-    lines = []
-    start = time.time()
-    while time.time() - start < timeout:
-        if ser.in_waiting:
-            line = ser.readline().decode('utf-8', errors='ignore').strip()
-            if line:
-                lines.append(line)
-                if 'EOF' in line:
-                    break
-        else:
-            time.sleep(0.05)
-    return lines
+    for _ in range(READY_ATTEMPTS):
+        send_cmd(ser, "log start", wait=0)
+        line = wait_ready(ser, READY_TIMEOUT, accept=_is_ready_reply)
+        if line:
+            return line
+    return b''
+
+
+# Шаблоны extract_outgoing_neighbors (компилируются один раз; хопы 2/4/6 hex = 1B/2B/3B)
+_RE_FOUND_PATHS = re.compile(r'Found \d+ unique path\(s\):\s*')
+_RE_FOUND_PATH_LINE = re.compile(r'^[\da-fA-F]{2,6}(,[\da-fA-F]{2,6})+$')
+_RE_SENDER_PREFIX = re.compile(r'^([^:\n]+):\s')
+_RE_HEX_HOP = re.compile(r'[0-9a-fA-F]{2,6}')
+_RE_HEX_PREFIX_LINE = re.compile(r'^([0-9a-fA-F]{2,6}):\s')
+_RE_ACK_HOPS = re.compile(r'(?:ack)?@\[[^\]]*\]\s+([\da-fA-F]{2,6}(?:,\s*[\da-fA-F]{2,6})+)')
+_RE_EQ_HOPS = re.compile(r'@\[[^\]]*\][^\n=]*=\s*([\da-fA-F]{2,6}(?:,\s*[\da-fA-F]{2,6})+)')
 
 
 def extract_outgoing_neighbors(text):
@@ -1142,12 +1479,11 @@ def extract_outgoing_neighbors(text):
 
     # Паттерн 1: "Found N unique path(s):" + строки "XX,YY,..." (2/4/6 hex на хоп
     # для 1B/2B/3B путей, MeshCore 1.14+).
-    re_line = re.compile(r'^[\da-fA-F]{2,6}(,[\da-fA-F]{2,6})+$')
-    parts = re.split(r'Found \d+ unique path\(s\):\s*', text)
+    parts = _RE_FOUND_PATHS.split(text)
     for part in parts[1:]:
         for line in part.split('\n'):
             line = line.strip().replace(' ', '')
-            if re_line.match(line):
+            if _RE_FOUND_PATH_LINE.match(line):
                 hops = [h.strip().upper() for h in line.split(',')]
                 neighbors.extend(_outgoing_neighbors_from_path(hops))
             else:
@@ -1161,12 +1497,11 @@ def extract_outgoing_neighbors(text):
     # Если первая non-blank строка начинается с "..." — это продолжение,
     # пропускаем весь паттерн. Критерий "первый — мой репитер, второй —
     # нет" защищает от ложных срабатываний на чат-сообщениях.
-    hex_prefix = r'[0-9a-fA-F]{2,6}'
-    sender_match = re.match(r'^([^:\n]+):\s', text)
+    sender_match = _RE_SENDER_PREFIX.match(text)
     # Если "отправитель" сам выглядит как hex-хоп (т.е. сообщение пришло без
     # префикса имени и сразу начинается с "HEX:"), префикс НЕ срезаем,
     # иначе потеряем первый хоп пути.
-    if sender_match and not re.fullmatch(r'[0-9a-fA-F]{2,6}', sender_match.group(1).strip()):
+    if sender_match and not _RE_HEX_HOP.fullmatch(sender_match.group(1).strip()):
         msg = text[sender_match.end():]
     else:
         msg = text
@@ -1178,7 +1513,7 @@ def extract_outgoing_neighbors(text):
             s = line.strip()
             if not s:
                 continue   # пустые строки игнорируем
-            m = re.match(r'^(' + hex_prefix + r'):\s', s)
+            m = _RE_HEX_PREFIX_LINE.match(s)
             if m:
                 prefixes.append(m.group(1).upper())
             elif prefixes:
@@ -1187,10 +1522,7 @@ def extract_outgoing_neighbors(text):
 
     # Паттерн 3: "ack@[имя] XX,YY,..." или "@[имя] XX,YY,..." сразу после имени.
     # Хопы 2/4/6 hex (1B/2B/3B per hop). Принимаем ответ ЛЮБОМУ адресату.
-    m = re.search(
-        r'(?:ack)?@\[[^\]]*\]\s+([\da-fA-F]{2,6}(?:,\s*[\da-fA-F]{2,6})+)',
-        text,
-    )
+    m = _RE_ACK_HOPS.search(text)
     if m:
         hops = [h.strip().upper() for h in m.group(1).split(',')]
         neighbors.extend(_outgoing_neighbors_from_path(hops))
@@ -1199,10 +1531,7 @@ def extract_outgoing_neighbors(text):
     #   "@[name] pong [2b 13h] = XX,YY,..."
     #   "@[name] <любой текст без '=' и переноса> = XX,YY,..."
     # Имя адресата не важно.
-    m = re.search(
-        r'@\[[^\]]*\][^\n=]*=\s*([\da-fA-F]{2,6}(?:,\s*[\da-fA-F]{2,6})+)',
-        text,
-    )
+    m = _RE_EQ_HOPS.search(text)
     if m:
         hops = [h.strip().upper() for h in m.group(1).split(',')]
         neighbors.extend(_outgoing_neighbors_from_path(hops))
@@ -1210,11 +1539,18 @@ def extract_outgoing_neighbors(text):
     return neighbors
 
 
+def _raw_line_time(line: str) -> str:
+    """Время пакета — часть U RAW-строки до маркера ('?', если его там нет)."""
+    head = line[:line.find('U RAW:')]
+    return head.strip() if head.endswith(' ') else '?'
+
+
 def _process_parsed_raw(
     parsed: dict,
     hex_str: str,
     *,
     pkt_time: str = '?',
+    raw_line: str | None = None,
     debug: dict | None = None,
     record_usb_recent: bool = True,
     mqtt_attach_snr: bool = False,
@@ -1224,35 +1560,45 @@ def _process_parsed_raw(
 
     USB (U RAW:) передаёт debug и record_usb_recent=True. MQTT JSON с полем raw — без debug,
     record_usb_recent=False; если mqtt_attach_snr, SNR из JSON привязывается к соседу как в RX.
+    USB передаёт вместо pkt_time саму строку raw_line; время из неё выделяется
+    только когда нужно (журнал -d, новый рекорд хопов).
     """
     global _last_raw_neighbor
     is_direct_trace = (
         parsed['payload_type'] == 0x09
         and parsed['route_type'] in (0x02, 0x03)
     )
-    pkt_label = f"{parsed['route_name']} {parsed['payload_name']}"
-    path_str = ','.join(parsed['path']) if parsed['path'] else '-'
     hops = len(parsed['path'])
-
-    if record_usb_recent:
+    # Подпись и строка пути нужны только для вывода (VERBOSE, -d) и первых
+    # примеров RAW за цикл — в остальных случаях их не собираем.
+    want_sample = debug is not None and debug.get('raw_lines', 0) <= 3
+    if VERBOSE or DEBUG_MODE or want_sample:
+        pkt_label = f"{parsed['route_name']} {parsed['payload_name']}"
+        path_str = ','.join(parsed['path']) if parsed['path'] else '-'
+
+    # Недавние RAW нужны только для сопоставления hash<->RAW в отладке (-d).
+    if record_usb_recent and DEBUG_MODE:
         route_char = 'F' if parsed.get('route_type') in (0x00, 0x01) else (
             'D' if parsed.get('route_type') in (0x02, 0x03) else None
         )
         payload_len = len(parsed.get('payload') or b'')
-        _recent_raw_usb.append({
-            'payload_type': parsed.get('payload_type'),
-            'route_char': route_char,
-            'payload_len': payload_len,
-            'hex': hex_str,
-            'path': parsed.get('path') or [],
-        })
+        _recent_raw_usb.append((
+            parsed.get('payload_type'),
+            route_char,
+            payload_len,
+            hex_str,
+            parsed.get('path') or [],
+        ))
 
     decrypted = None
     outgoing_nbs_bot = []
     outgoing_nbs_path = []
     outgoing_nbs_trace = []
     if parsed['payload_type'] in (0x05, 0x06) and parsed['payload']:
-        decrypted = decrypt_group_msg(parsed['payload'])
+        if 'decrypted' in parsed:
+            decrypted = parsed['decrypted']   # уже расшифровано при выборе path_len
+        else:
+            decrypted = decrypt_group_msg(parsed['payload'])
         if decrypted and BOTS_MODE:
             extracted = extract_outgoing_neighbors(decrypted['text'])
             # Дедуп через _record_outgoing: каждая пара (payload, neighbor)
@@ -1274,10 +1620,10 @@ def _process_parsed_raw(
             if len(parsed['path']) >= 2:
                 nb = parsed['path'][-2]
                 if not is_my_repeater(nb):
-                    neighbor_stats[nb]['total'] += 1
+                    neighbor_stats[nb].total += 1
                     _last_raw_neighbor = nb
         else:
-            neighbor_stats[last]['total'] += 1
+            neighbor_stats[last].total += 1
             _last_raw_neighbor = last
             direct_to_obs = True
 
@@ -1324,8 +1670,8 @@ def _process_parsed_raw(
                 # Попытка трассы — увеличиваем при первом наблюдении уникального
                 # trace_tag (на любой стадии: start/середина/return).
                 if tag and tag not in _trace_attempts_seen:
-                    neighbor_stats[nb]['trace_attempts'] += 1
-                    _trace_attempts_seen.add(tag)
+                    neighbor_stats[nb].trace_attempts += 1
+                    _lru_add(_trace_attempts_seen, tag, SEEN_MAX)
 
                 # SNR→ nb (forward): значение, которое сосед добавил, услышав
                 # последний из наших репитеров. На wire это ts[i].
@@ -1333,11 +1679,12 @@ def _process_parsed_raw(
                 # одного и того же ответа.
                 if (len(ts) > i and tag
                         and tag not in _trace_out_seen):
-                    neighbor_stats[nb]['total'] += 1
-                    neighbor_stats[nb]['trace_out_sum'] += ts[i]
-                    neighbor_stats[nb]['trace_out_count'] += 1
-                    outgoing_stats[nb]['total'] += 1
-                    _trace_out_seen.add(tag)
+                    nbs = neighbor_stats[nb]
+                    nbs.total += 1
+                    nbs.trace_out_sum += ts[i]
+                    nbs.trace_out_count += 1
+                    outgoing_stats[nb] += 1
+                    _lru_add(_trace_out_seen, tag, SEEN_MAX)
                     outgoing_nbs_trace.append(nb)
 
                 # SNR← nb (return): момент, когда наблюдатель только что принял
@@ -1353,30 +1700,27 @@ def _process_parsed_raw(
                         and tag and tag not in _trace_in_seen):
                     try:
                         s_back = float(mqtt_snr)
-                        neighbor_stats[nb]['trace_in_sum'] += s_back
-                        neighbor_stats[nb]['trace_in_count'] += 1
-                        neighbor_stats[nb]['trace_ok'] += 1
-                        _trace_in_seen.add(tag)
+                        nbs = neighbor_stats[nb]
+                        nbs.trace_in_sum += s_back
+                        nbs.trace_in_count += 1
+                        nbs.trace_ok += 1
+                        _lru_add(_trace_in_seen, tag, SEEN_MAX)
                     except (TypeError, ValueError):
                         pass
 
-                # Лёгкая защита от утечки памяти: если множества разрослись —
-                # сбрасываем (TRACE-теги уникальны и никогда не повторяются,
-                # старые забывать безопасно).
-                for _seen in (_trace_attempts_seen, _trace_out_seen, _trace_in_seen):
-                    if len(_seen) > 4096:
-                        _seen.clear()
-
     if mqtt_attach_snr and mqtt_snr is not None and _last_raw_neighbor:
         try:
             s = float(mqtt_snr)
-            nb = _last_raw_neighbor
-            neighbor_stats[nb]['snr_sum'] += s
-            neighbor_stats[nb]['snr_count'] += 1
+            nbs = neighbor_stats[_last_raw_neighbor]
+            nbs.snr_sum += s
+            nbs.snr_count += 1
         except (TypeError, ValueError):
             pass
 
     if VERBOSE:
+        # USB-строки разбирает основной цикл и сбрасывает stdout один раз на
+        # пачку строк; MQTT-поток печатает сам — ему нужен flush на каждую.
+        flush = not record_usb_recent
         if outgoing_nbs_bot or outgoing_nbs_path:
             color, end = f"{MAGENTA}{BOLD}", RESET
         elif direct_to_obs:
@@ -1407,7 +1751,7 @@ def _process_parsed_raw(
                     rx_tag = f" rxSNR={float(mqtt_snr):.2f}"
                 except (TypeError, ValueError):
                     pass
-            print(f"{CYAN}    -> {pkt_label} | route=[{route_str}] SNR=[{snr_str}]{rx_tag}{mode_tag}{RESET}", flush=True)
+            print(f"{CYAN}    -> {pkt_label} | route=[{route_str}] SNR=[{snr_str}]{rx_tag}{mode_tag}{RESET}", flush=flush)
         else:
             bph = parsed.get('path_bytes_per_hop', 1)
             mode_tag = ""
@@ -1417,24 +1761,26 @@ def _process_parsed_raw(
                 mode_tag = f" {MAGENTA}{BOLD}[3B]{RESET}{color}"
             dest_tag = f" -> {parsed['dest']}" if parsed.get('dest') else ""
             src_tag = f"{CYAN}[MQTT] {RESET}" if not record_usb_recent else ""
-            print(f"{src_tag}{color}    -> {pkt_label} | hops={hops} path=[{path_str}]{mode_tag}{dest_tag}{obs_tag}{end}", flush=True)
+            print(f"{src_tag}{color}    -> {pkt_label} | hops={hops} path=[{path_str}]{mode_tag}{dest_tag}{obs_tag}{end}", flush=flush)
         if decrypted:
             text = decrypted['text']
-            if ': ' in text:
-                sender, body = text.split(': ', 1)
-                print(f"{color}       {decrypted['channel']}: {sender}:{end}", flush=True)
+            sender, sep, body = text.partition(': ')
+            if sep:
+                print(f"{color}       {decrypted['channel']}: {sender}:{end}", flush=flush)
                 for tl in body.split('\n'):
-                    print(f"{color}       {tl}{end}", flush=True)
+                    print(f"{color}       {tl}{end}", flush=flush)
             else:
-                print(f"{color}       {decrypted['channel']}: {text}{end}", flush=True)
+                print(f"{color}       {decrypted['channel']}: {text}{end}", flush=flush)
         if outgoing_nbs_bot:
-            print(f"{MAGENTA}       ^^^ бот: исходящий сосед: {','.join(outgoing_nbs_bot)}{RESET}", flush=True)
+            print(f"{MAGENTA}       ^^^ бот: исходящий сосед: {','.join(outgoing_nbs_bot)}{RESET}", flush=flush)
         if outgoing_nbs_path:
-            print(f"{MAGENTA}       ^^^ путь: исходящий сосед: {','.join(outgoing_nbs_path)}{RESET}", flush=True)
+            print(f"{MAGENTA}       ^^^ путь: исходящий сосед: {','.join(outgoing_nbs_path)}{RESET}", flush=flush)
         if outgoing_nbs_trace:
-            print(f"{MAGENTA}       ^^^ trace: исходящий сосед: {','.join(outgoing_nbs_trace)}{RESET}", flush=True)
+            print(f"{MAGENTA}       ^^^ trace: исходящий сосед: {','.join(outgoing_nbs_trace)}{RESET}", flush=flush)
 
     if DEBUG_MODE:
+        if raw_line is not None:
+            pkt_time = _raw_line_time(raw_line)
         dest_info = f" -> {parsed['dest']}" if parsed.get('dest') else ""
         obs_info = " [OBS]" if direct_to_obs else ""
         dec_info = ""
@@ -1458,13 +1804,14 @@ def _process_parsed_raw(
     is_trace = is_direct_trace
     if not is_trace:
         for node_hash in parsed['path']:
-            stats[node_hash].setdefault('hops_seen', 0)
-            stats[node_hash]['hops_seen'] += 1
+            stats[node_hash].hops_seen += 1
 
         bph = parsed.get('path_bytes_per_hop', 1)
         if bph in (1, 2, 3):
             rec = max_hops_by_bph.get(bph)
             if rec is None or hops > rec.get('hops', 0):
+                if raw_line is not None:
+                    pkt_time = _raw_line_time(raw_line)
                 max_hops_by_bph[bph] = {
                     'time': pkt_time,
                     'hops': hops,
@@ -1476,7 +1823,7 @@ def _process_parsed_raw(
                     'payload': parsed['payload'],
                 }
 
-    if debug is not None and debug.get('raw_lines', 0) <= 3:
+    if want_sample:
         debug.setdefault('raw_samples', []).append(
             f"{pkt_label} | hops={hops} path=[{path_str}]"
         )
@@ -1485,7 +1832,158 @@ def _process_parsed_raw(
         _last_raw_neighbor = None
 
 
-def parse_line(line, stats, debug):
+def _parse_rx_line(line, stats, debug):
+    """RX-строка: SNR/RSSI/ошибки источника, сопоставление hash<->U RAW (см. parse_line)."""
+    global _last_raw_neighbor
+    debug['rx_lines'] += 1
+    if debug['rx_lines'] <= 3:
+        debug.setdefault('rx_samples', []).append(line)
+    try:
+        # type, SNR, RSSI; тип пакета нужен и для сопоставления hash<->U RAW.
+        m = _RE_RX.search(line)
+        ptype = int(m.group(1)) if m else None
+
+        global _usb_hashes_curr, _usb_hash_to_line_curr
+        global _usb_hash_to_raw_curr
+        if 'hash=' in line:
+            try:
+                pkt_hash = line.partition('hash=')[2].split(None, 1)[0]
+                if pkt_hash:
+                    _usb_hashes_curr.add(pkt_hash)
+                    # Запоминаем пример строки для этого hash (только первый раз)
+                    _usb_hash_to_line_curr.setdefault(pkt_hash, line)
+
+                    # Если есть недавний U RAW, пытаемся сопоставить его с этой RX-строкой
+                    # по (type, route, payload_len). Это нужно только для отладки.
+                    if DEBUG_MODE and _recent_raw_usb:
+                        try:
+                            route_char = None
+                            if 'route=' in line:
+                                route_char = line.partition('route=')[2].partition(',')[0].strip()
+                            payload_len = None
+                            if 'payload_len=' in line:
+                                payload_len = int(line.partition('payload_len=')[2].partition(')')[0])
+                        except Exception:
+                            route_char = None
+                            payload_len = None
+
+                        if route_char and payload_len is not None:
+                            for e_type, e_route, e_len, e_hex, e_path in reversed(_recent_raw_usb):
+                                if (ptype is not None and
+                                        e_type == ptype and
+                                        e_route == route_char and
+                                        e_len == payload_len):
+                                    _usb_hash_to_raw_curr.setdefault(pkt_hash, {
+                                        'hex': e_hex,
+                                        'path': e_path,
+                                    })
+                                    break
+            except IndexError:
+                pass
+
+        # Без type/SNR/RSSI строка не годится для статистики
+        if m is None:
+            debug['malformed'] += 1
+            return
+        # Адреса отправителя и получателя [src->dst] — из того же совпадения
+        # _RE_RX; все группы одним groups(), а не group() на каждое поле
+        _, snr, rssi, src, dst = m.groups()
+        snr = float(snr)
+        rssi = int(rssi)
+        if src is not None:
+            dst = dst.strip()
+            # Ключ stats: один объект строки на адрес вместо новой на каждую строку лога
+            src = sys.intern(src.strip())
+
+        # Если источник известен — обновляем его статистику;
+        # иначе относим пакет к широковещательным
+        if src:
+            node = stats[src]
+        else:
+            node = stats[BROADCAST_NODE]
+            src = BROADCAST_NODE
+            debug['broadcast_rx'] += 1
+
+        # Обновляем счётчики RX и показатели качества сигнала
+        node.rx += 1
+        node.snr_sum += snr
+        node.snr_count += 1
+        node.rssi_sum += rssi
+        node.rssi_count += 1
+
+        # score=0 означает пакет с нулевой оценкой (повреждённый/сомнительный)
+        if 'score=0' in line:
+            node.errors += 1
+
+        # Привязываем SNR к соседу из предыдущего RAW-пакета
+        if _last_raw_neighbor:
+            nbs = neighbor_stats[_last_raw_neighbor]
+            nbs.snr_sum += snr
+            nbs.snr_count += 1
+            _last_raw_neighbor = None
+
+        if not src:
+            debug['no_src_dst'] += 1
+
+    except Exception as e:
+        debug['exception'] += 1
+        debug['last_exception'] = str(e)
+
+
+def _parse_tx_line(line, stats, debug):
+    """TX-строка: счётчик tx источника (или BROADCAST)."""
+    debug['tx_lines'] += 1
+    try:
+        type_part = line.partition('type=')[2].partition(',')[0]
+        ptype = int(type_part)
+
+        # Извлекаем адреса аналогично RX
+        src = None
+        dst = None
+        if '[' in line and ']' in line:
+            bracket = line.partition('[')[2].partition(']')[0]
+            if '->' in bracket:
+                src, dst = [x.strip() for x in bracket.split('->')]
+                # Ключ stats: один объект строки на адрес вместо новой на каждую строку лога
+                src = sys.intern(src)
+
+        if src:
+            stats[src].tx += 1
+        else:
+            stats[BROADCAST_NODE].tx += 1
+            debug['broadcast_tx'] += 1
+
+    except Exception as e:
+        debug['exception_tx'] += 1
+        debug['last_exception_tx'] = str(e)
+
+
+def _parse_raw_line(line, stats, debug):
+    """U RAW-строка: заголовок и path через parse_raw(), дальше — _process_parsed_raw()."""
+    debug.setdefault('raw_lines', 0)
+    debug['raw_lines'] += 1
+
+    # Только hex-хвост: левая часть (время) нужна редко — см. _raw_line_time
+    hex_str = line[line.find('U RAW:') + 6:].strip()
+    parsed = parse_raw(hex_str)
+    if parsed:
+        _process_parsed_raw(
+            parsed, hex_str, raw_line=line, debug=debug, record_usb_recent=True,
+        )
+    else:
+        if debug['raw_lines'] <= 3:
+            debug.setdefault('raw_samples', []).append(line)
+
+
+# Маркер типа строки лога (6 байт) -> обработчик
+_LINE_HANDLERS = {
+    b'U: RX,': _parse_rx_line,
+    b'U: TX,': _parse_tx_line,
+    b'U RAW:': _parse_raw_line,
+}
+
+
+def parse_line(raw, stats, debug):
     """Парсит одну строку лога и обновляет статистику по узлам.
 
     Формат строк лога Meshcore (примеры):
@@ -1499,184 +1997,79 @@ def parse_line(line, stats, debug):
     Пакеты с score=0 считаются ошибочными.
 
     Args:
-        line: строка лога
+        raw: строка лога как bytes (без перевода строки); декодируется
+             только если не отброшена как служебная
         stats: глобальный словарь статистики (defaultdict)
         debug: словарь отладочных счётчиков текущего цикла
     """
-    global _last_raw_neighbor
     debug['total'] += 1
 
-    # Пропускаем служебные строки (команда log, маркер EOF, пустые)
-    if not line or line.startswith('log') or 'EOF' in line:
+    # Пропускаем служебные строки (команда log, маркер EOF, пустые) ещё до декодирования
+    if not raw or raw.startswith(b'log') or b'EOF' in raw:
         debug['ignored'] += 1
         return
 
-    # Прошивка может писать служебный шум эфира (мешает живому выводу).
-    # Эти строки не показываем, но собираем среднее noise_floor за цикл.
-    if 'noise_floor' in line and 'RadioLibWrapper' in line:
-        m = re.search(r'noise_floor\s*=\s*(-?\d+)', line)
-        if m:
-            nf = int(m.group(1))
-            debug['noise_floor_sum'] = debug.get('noise_floor_sum', 0) + nf
-            debug['noise_floor_count'] = debug.get('noise_floor_count', 0) + 1
+    # Тип строки определяем один раз по bytes и сразу выбираем обработчик;
+    # декодируем только то, что действительно разбирается или печатается.
+    # Все маркеры начинаются с 'U': один find() + поиск в словаре вместо
+    # трёх полных проходов по строке (обычно первая 'U' и есть маркер).
+    handler = None
+    i = raw.find(b'U')
+    while i >= 0:
+        handler = _LINE_HANDLERS.get(raw[i:i + 6])
+        if handler is not None:
+            break
+        i = raw.find(b'U', i + 1)
+    if handler is None:
+        # Прошивка может писать служебный шум эфира (мешает живому выводу).
+        # Эти строки не показываем, но собираем среднее noise_floor за цикл.
+        if b'noise_floor' in raw and b'RadioLibWrapper' in raw:
+            m = _RE_NOISE_FLOOR.search(raw)
+            if m:
+                nf = int(m.group(1))
+                debug['noise_floor_sum'] = debug.get('noise_floor_sum', 0) + nf
+                debug['noise_floor_count'] = debug.get('noise_floor_count', 0) + 1
+            debug['ignored'] += 1
+            return
+        # Строки, не являющиеся ни RX, ни TX, ни RAW, — игнорируем
         debug['ignored'] += 1
+        if VERBOSE or debug['ignored'] <= 5:
+            line = raw.decode('utf-8', errors='ignore')
+            if VERBOSE:
+                print(f"  {line}")
+            if debug['ignored'] <= 5:
+                debug['ignored_samples'].append(line)
         return
 
+    line = raw.decode('utf-8', errors='ignore')
     if VERBOSE:
-        print(f"  {line}", flush=True)
+        print(f"  {line}")  # stdout сбрасывает основной цикл после пачки строк
+    handler(line, stats, debug)
 
-    # --- Обработка входящих пакетов (RX) ---
-    if 'U: RX,' in line:
-        debug['rx_lines'] += 1
-        if debug['rx_lines'] <= 3:
-            debug.setdefault('rx_samples', []).append(line)
-        try:
-            # Тип пакета нужен дальше, в том числе для сопоставления hash<->U RAW.
-            ptype = None
-            if 'type=' in line:
-                type_part = line.split('type=')[1].split(',')[0]
-                ptype = int(type_part)
-
-            global _usb_hashes_curr, _usb_hash_to_line_curr
-            global _usb_hash_to_raw_curr
-            if 'hash=' in line:
-                try:
-                    pkt_hash = line.split('hash=')[1].split()[0]
-                    if pkt_hash:
-                        _usb_hashes_curr.add(pkt_hash)
-                        # Запоминаем пример строки для этого hash (только первый раз)
-                        _usb_hash_to_line_curr.setdefault(pkt_hash, line)
-
-                        # Если есть недавний U RAW, пытаемся сопоставить его с этой RX-строкой
-                        # по (type, route, payload_len). Это нужно только для отладки.
-                        if DEBUG_MODE and _recent_raw_usb:
-                            try:
-                                route_char = None
-                                if 'route=' in line:
-                                    route_char = line.split('route=')[1].split(',')[0].strip()
-                                payload_len = None
-                                if 'payload_len=' in line:
-                                    payload_len = int(line.split('payload_len=')[1].split(')')[0])
-                            except Exception:
-                                route_char = None
-                                payload_len = None
-
-                            if route_char and payload_len is not None:
-                                for entry in reversed(_recent_raw_usb):
-                                    if (ptype is not None and
-                                            entry.get('payload_type') == ptype and
-                                            entry.get('route_char') == route_char and
-                                            entry.get('payload_len') == payload_len):
-                                        _usb_hash_to_raw_curr.setdefault(pkt_hash, {
-                                            'hex': entry.get('hex'),
-                                            'path': entry.get('path'),
-                                        })
-                                        break
-                except IndexError:
-                    pass
 
-            # Извлекаем SNR и RSSI из строки
-            if 'SNR=' in line and 'RSSI=' in line:
-                snr_part = line.split('SNR=')[1].split()[0]
-                rssi_part = line.split('RSSI=')[1].split()[0]
-                snr = float(snr_part)
-                rssi = int(rssi_part)
-            else:
-                debug['malformed'] += 1
-                return
+@functools.lru_cache(maxsize=1024)
+def _node_color(node: str) -> str:
+    """ANSI-цвет строки таблицы для узла: ретранслятор — голубой, своя нода — зелёный.
 
-            # Извлекаем тип пакета (type=N)
-            if ptype is None:
-                type_part = line.split('type=')[1].split(',')[0]
-                ptype = int(type_part)
-
-            # Извлекаем адреса отправителя и получателя из квадратных скобок [src->dst]
-            src = None
-            dst = None
-            if '[' in line and ']' in line:
-                bracket = line.split('[')[1].split(']')[0]
-                if '->' in bracket:
-                    src, dst = [x.strip() for x in bracket.split('->')]
-
-            # Если источник известен — обновляем его статистику;
-            # иначе относим пакет к широковещательным
-            if src:
-                node = stats[src]
-            else:
-                node = stats[BROADCAST_NODE]
-                src = BROADCAST_NODE
-                debug['broadcast_rx'] += 1
-
-            # Обновляем счётчики RX и показатели качества сигнала
-            node['rx'] += 1
-            node['snr_sum'] += snr
-            node['snr_count'] += 1
-            node['rssi_sum'] += rssi
-            node['rssi_count'] += 1
-
-            # score=0 означает пакет с нулевой оценкой (повреждённый/сомнительный)
-            if 'score=0' in line:
-                node['errors'] += 1
-
-            # Привязываем SNR к соседу из предыдущего RAW-пакета
-            if _last_raw_neighbor:
-                neighbor_stats[_last_raw_neighbor]['snr_sum'] += snr
-                neighbor_stats[_last_raw_neighbor]['snr_count'] += 1
-                _last_raw_neighbor = None
-
-            if not src:
-                debug['no_src_dst'] += 1
+    Набор узлов ограничен, поэтому результат кешируется (сбрасывается
+    при смене MY_REPEATERS_HEX из CLI).
+    """
+    if is_my_repeater(node):
+        return CYAN
+    if node.upper().startswith(NODE_PREFIX.upper()):
+        return GREEN
+    return ''
 
-        except Exception as e:
-            debug['exception'] += 1
-            debug['last_exception'] = str(e)
 
-    # --- Обработка исходящих пакетов (TX) ---
-    elif 'U: TX,' in line:
-        debug['tx_lines'] += 1
-        try:
-            type_part = line.split('type=')[1].split(',')[0]
-            ptype = int(type_part)
-
-            # Извлекаем адреса аналогично RX
-            src = None
-            dst = None
-            if '[' in line and ']' in line:
-                bracket = line.split('[')[1].split(']')[0]
-                if '->' in bracket:
-                    src, dst = [x.strip() for x in bracket.split('->')]
-
-            if src:
-                stats[src]['tx'] += 1
-            else:
-                stats[BROADCAST_NODE]['tx'] += 1
-                debug['broadcast_tx'] += 1
+def _write_lines(lines):
+    """Выводит строки таблицы одной записью в stdout вместо print() на каждую."""
+    sys.stdout.write('\n'.join(lines) + '\n')
+    sys.stdout.flush()
 
-        except Exception as e:
-            debug['exception_tx'] += 1
-            debug['last_exception_tx'] = str(e)
-
-    # --- Сырые пакеты (U RAW:) — парсим заголовок и path ---
-    elif 'U RAW:' in line:
-        debug.setdefault('raw_lines', 0)
-        debug['raw_lines'] += 1
-
-        hex_str = line.split('U RAW:')[1].strip()
-        parsed = parse_raw(hex_str)
-        pkt_time = line.split(' U RAW:')[0].strip() if ' U RAW:' in line else '?'
-        if parsed:
-            _process_parsed_raw(
-                parsed, hex_str, pkt_time=pkt_time, debug=debug, record_usb_recent=True,
-            )
-        else:
-            if debug['raw_lines'] <= 3:
-                debug.setdefault('raw_samples', []).append(line)
 
-    # --- Строки, не являющиеся ни RX, ни TX, ни RAW — игнорируем ---
-    else:
-        debug['ignored'] += 1
-        if debug['ignored'] <= 5:
-            debug['ignored_samples'].append(line)
+# Строка таблицы print_stats: %-форматирование заметно быстрее f-строки
+# с семью спецификаторами на каждый узел.
+_STATS_ROW_FMT = '%-8s %6d %6d %6d %8d %7.1fdB %7.1fdB'
 
 
 def print_stats(stats, cycle_info, debug, skip_cumulative=False):
@@ -1699,95 +2092,152 @@ def print_stats(stats, cycle_info, debug, skip_cumulative=False):
         cycle_info: dict с данными текущего цикла (num, lines_read, rx_this, tx_this)
         debug: dict с отладочными счётчиками
     """
-    print("\n" + "=" * 70)
-    print(f"ЦИКЛ {cycle_info['num']} (прочитано строк: {cycle_info['lines_read']})")
-    print("=" * 70)
+    out = []  # строки таблицы: выводятся одной записью в конце
+    out.append("\n" + "=" * 70)
+    out.append(f"ЦИКЛ {cycle_info['num']} (прочитано строк: {cycle_info['lines_read']})")
+    out.append("=" * 70)
 
     # В MQTT-only режиме весь блок диагностики USB-парсера всегда показывает
     # нули (parse_line() не вызывается), поэтому скрываем его так же,
     # как и накопительную таблицу.
     if not skip_cumulative:
-        print("ДИАГНОСТИКА ПАРСИНГА (за этот цикл):")
-        print(f"   Всего обработано: {debug.get('total', 0)}")
-        print(f"   RX строк: {debug.get('rx_lines', 0)}")
-        print(f"   TX строк: {debug.get('tx_lines', 0)}")
-        print(f"   Broadcast RX: {debug.get('broadcast_rx', 0)}")
-        print(f"   Broadcast TX: {debug.get('broadcast_tx', 0)}")
-        print(f"   Игнорировано: {debug.get('ignored', 0)}")
-        print(f"   Malformed: {debug.get('malformed', 0)}")
-        print(f"   U RAW строк: {debug.get('raw_lines', 0)}")
-        print(f"   Исключения RX: {debug.get('exception', 0)}")
-        print(f"   Исключения TX: {debug.get('exception_tx', 0)}")
+        out.append("ДИАГНОСТИКА ПАРСИНГА (за этот цикл):")
+        out.append(f"   Всего обработано: {debug.get('total', 0)}")
+        out.append(f"   RX строк: {debug.get('rx_lines', 0)}")
+        out.append(f"   TX строк: {debug.get('tx_lines', 0)}")
+        out.append(f"   Broadcast RX: {debug.get('broadcast_rx', 0)}")
+        out.append(f"   Broadcast TX: {debug.get('broadcast_tx', 0)}")
+        out.append(f"   Игнорировано: {debug.get('ignored', 0)}")
+        out.append(f"   Malformed: {debug.get('malformed', 0)}")
+        out.append(f"   U RAW строк: {debug.get('raw_lines', 0)}")
+        out.append(f"   Исключения RX: {debug.get('exception', 0)}")
+        out.append(f"   Исключения TX: {debug.get('exception_tx', 0)}")
 
         if debug.get('rx_samples'):
-            print(f"\nПримеры RX строк ({debug.get('rx_lines', 0)} всего):")
+            out.append(f"\nПримеры RX строк ({debug.get('rx_lines', 0)} всего):")
             for i, s in enumerate(debug['rx_samples'], 1):
-                print(f"   {i}: {s}")
+                out.append(f"   {i}: {s}")
 
         if debug.get('raw_lines'):
-            print(f"\nU RAW пакетов: {debug['raw_lines']}")
+            out.append(f"\nU RAW пакетов: {debug['raw_lines']}")
             if debug.get('raw_samples'):
-                print("Примеры:")
+                out.append("Примеры:")
                 for i, s in enumerate(debug['raw_samples'], 1):
-                    print(f"   {i}: {s}")
+                    out.append(f"   {i}: {s}")
 
         if debug.get('ignored_samples'):
-            print(f"\nПримеры игнорированных строк:")
+            out.append(f"\nПримеры игнорированных строк:")
             for i, s in enumerate(debug['ignored_samples'], 1):
-                print(f"   {i}: {repr(s)}")
+                out.append(f"   {i}: {repr(s)}")
 
-        print("-" * 70)
+        out.append("-" * 70)
 
     if skip_cumulative:
-        num_nodes = len([n for n in stats if n != BROADCAST_NODE])
-        print(f"\nЗА ЭТОТ ЦИКЛ: RX: {cycle_info['rx_this']}, TX: {cycle_info['tx_this']}")
-        print(f"ВСЕГО уникальных узлов: {num_nodes}")
-        print("=" * 70)
+        num_nodes = len([n for n in list(stats) if n != BROADCAST_NODE])
+        out.append(f"\nЗА ЭТОТ ЦИКЛ: RX: {cycle_info['rx_this']}, TX: {cycle_info['tx_this']}")
+        out.append(f"ВСЕГО уникальных узлов: {num_nodes}")
+        out.append("=" * 70)
+        _write_lines(out)
         return
 
-    # Сортируем узлы по среднему SNR (лучший сигнал — сверху)
-    sorted_nodes = sorted(
-        stats.items(),
-        key=lambda x: x[1]['snr_sum'] / x[1]['snr_count'] if x[1]['snr_count'] > 0 else -1000,
-        reverse=True
-    )
-
-    total_rx_all = sum(d['rx'] for d in stats.values())
-    print(f"\nНАКОПИТЕЛЬНАЯ СТАТИСТИКА (всего RX: {total_rx_all}):")
-    print(f"{'Узел':<8} {'RX':>6} {'TX':>6} {'Hops':>6} {'Ошибки':>8} {'SNR ср':>8} {'RSSI ср':>8}")
-    print("-" * 70)
-
-    for node, data in sorted_nodes:
-        avg_snr = data['snr_sum'] / data['snr_count'] if data['snr_count'] > 0 else 0
-        avg_rssi = data['rssi_sum'] / data['rssi_count'] if data['rssi_count'] > 0 else 0
-        hops_seen = data.get('hops_seen', 0)
+    # Сортируем узлы по среднему SNR (лучший сигнал — сверху). Среднее считаем
+    # один раз на узел и сортируем готовые кортежи (avg_snr, node, data);
+    # узлы без замеров SNR уходят вниз. Обходим копию: таблицу пополняют
+    # потоки MQTT и опроса API.
+    sorted_nodes = []
+    total_rx_all = 0
+    for node, data in list(stats.items()):
+        cnt = data.snr_count
+        sorted_nodes.append((data.snr_sum / cnt if cnt > 0 else -1000, node, data))
+        total_rx_all += data.rx
+    sorted_nodes.sort(key=itemgetter(0), reverse=True)
+
+    out.append(f"\nНАКОПИТЕЛЬНАЯ СТАТИСТИКА (всего RX: {total_rx_all}):")
+    out.append(f"{'Узел':<8} {'RX':>6} {'TX':>6} {'Hops':>6} {'Ошибки':>8} {'SNR ср':>8} {'RSSI ср':>8}")
+    out.append("-" * 70)
+
+    # Шаблон строки с цветом собирается один раз на цвет, а не на каждую строку
+    row_fmts = {'': _STATS_ROW_FMT}
+    for avg_snr, node, data in sorted_nodes:
+        if data.snr_count <= 0:
+            avg_snr = 0
+        avg_rssi = data.rssi_sum / data.rssi_count if data.rssi_count > 0 else 0
+        hops_seen = data.hops_seen
 
         if node == BROADCAST_NODE:
             base_name = "BCAST"
         else:
             base_name = node
 
-        base_line = f"{base_name:<8} {data['rx']:>6} {data['tx']:>6} {hops_seen:>6} {data['errors']:>8} {avg_snr:>7.1f}dB {avg_rssi:>7.1f}dB"
-
         # Цветовая раскраска: ноды — зелёным, ретрансляторы — голубым, broadcast — жёлтым
-        if node == BROADCAST_NODE:
-            print(f"{YELLOW}{BOLD}{base_line}{RESET}")
-        elif is_my_repeater(node):
-            print(f"{CYAN}{base_line}{RESET}")
-        elif node.startswith(NODE_PREFIX):
-            print(f"{GREEN}{base_line}{RESET}")
-        else:
-            print(base_line)
+        color = f"{YELLOW}{BOLD}" if node == BROADCAST_NODE else _node_color(node)
+        row_fmt = row_fmts.get(color)
+        if row_fmt is None:
+            row_fmt = row_fmts[color] = f"{color}{_STATS_ROW_FMT}{RESET}"
+        out.append(row_fmt % (base_name, data.rx, data.tx, hops_seen, data.errors, avg_snr, avg_rssi))
 
-    print("-" * 70)
+    out.append("-" * 70)
 
     # Общие итоги за цикл
-    num_nodes = len([n for n in stats if n != BROADCAST_NODE])
+    num_nodes = len([n for n in list(stats) if n != BROADCAST_NODE])
+
+    out.append(f"\nЗА ЭТОТ ЦИКЛ: RX: {cycle_info['rx_this']}, TX: {cycle_info['tx_this']}")
+    out.append(f"ВСЕГО уникальных узлов: {num_nodes}")
+
+    out.append("=" * 70)
+    _write_lines(out)
+
+
+_aes_ecb_factory = None  # key -> (ct -> plaintext), загружается при первом вызове
+_AES_CACHE = {}  # key -> готовая функция расшифровки (ключей — по числу каналов)
+
+
+def _load_aes_backend():
+    """Импортирует бэкенд CRYPTO_BACKEND и возвращает фабрику key -> (ct -> plaintext)."""
+    if CRYPTO_BACKEND == 'cryptography':
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
-    print(f"\nЗА ЭТОТ ЦИКЛ: RX: {cycle_info['rx_this']}, TX: {cycle_info['tx_this']}")
-    print(f"ВСЕГО уникальных узлов: {num_nodes}")
+        def _factory(key):
+            # ECB без состояния между блоками: один decryptor на ключ можно
+            # переиспользовать, пока на вход идут только целые блоки по 16 B.
+            return Cipher(algorithms.AES(key), modes.ECB()).decryptor().update
+        return _factory
 
-    print("=" * 70)
+    from Crypto.Cipher import AES
+
+    def _factory(key):
+        return AES.new(key, AES.MODE_ECB).decrypt
+    return _factory
+
+
+def _aes_ecb_decrypt(key: bytes, ct: bytes) -> bytes:
+    """AES-128-ECB decrypt через доступный бэкенд (см. CRYPTO_BACKEND).
+
+    ct должен быть кратен 16 байтам. Контекст шифра (расписание ключа)
+    создаётся один раз на ключ и хранится в _AES_CACHE.
+    """
+    decrypt = _AES_CACHE.get(key)
+    if decrypt is None:
+        global _aes_ecb_factory
+        if _aes_ecb_factory is None:
+            _aes_ecb_factory = _load_aes_backend()
+        decrypt = _AES_CACHE[key] = _aes_ecb_factory(key)
+    return decrypt(ct)
+
+
+# Печатные ASCII-символы с точки зрения str.isprintable() (0x20..0x7E; \t и \n — нет)
+_PRINTABLE_ASCII = bytes(range(0x20, 0x7F))
+
+
+def _mostly_printable(text: str) -> bool:
+    """True, если печатных символов больше половины (эвристика удачной расшифровки).
+
+    ASCII-текст проверяется в C через bytes.translate, остальное — посимвольно.
+    """
+    if text.isascii():
+        raw = text.encode('ascii')
+        return len(raw) - len(raw.translate(None, _PRINTABLE_ASCII)) > len(raw) // 2
+    return sum(c.isprintable() for c in text) > len(text) // 2
 
 
 def _decrypt_grp_mesh_v1(enc_part: bytes, secret32: bytes):
@@ -1798,14 +2248,13 @@ def _decrypt_grp_mesh_v1(enc_part: bytes, secret32: bytes):
     if hmac.new(secret32, ct, hashlib.sha256).digest()[:2] != mac:
         return None
     try:
-        cipher = AES.new(secret32[:16], AES.MODE_ECB)
-        plaintext = cipher.decrypt(ct)
+        plaintext = _aes_ecb_decrypt(secret32[:16], ct)
     except Exception:
         return None
     if len(plaintext) < 6:
         return None
     text = plaintext[5:].rstrip(b'\x00').decode('utf-8', errors='ignore').strip()
-    if text and sum(c.isprintable() for c in text) > len(text) // 2:
+    if text and _mostly_printable(text):
         return text
     return None
 
@@ -1836,14 +2285,17 @@ def decrypt_group_msg(payload):
         return None
 
     ch_hash = payload[0]
+    if not (CHANNEL_HASH_MASK >> ch_hash) & 1:
+        return None
     enc_part = bytes(payload[1:])
 
-    for ch_name, secret32 in CHANNEL_PSK.get(ch_hash, []):
+    for ch_name, secret32 in CHANNEL_PSK_TABLE[ch_hash]:
         text = _decrypt_grp_mesh_v1(enc_part, secret32)
         if text:
-            return {'channel': ch_name, 'hash': f"{ch_hash:02X}", 'text': text}
+            return {'channel': ch_name, 'hash': _HEX_BYTE[ch_hash], 'text': text}
 
-    if ch_hash not in CHANNEL_KEYS:
+    named = CHANNEL_KEYS_TABLE[ch_hash]
+    if not named:
         return None
 
     # Старый путь: только AES по ciphertext (MAC на wire всё равно 2 байта — пропускаем).
@@ -1851,23 +2303,77 @@ def decrypt_group_msg(payload):
     if len(ciphertext) == 0 or len(ciphertext) % 16 != 0:
         return None
 
-    for ch_name, key in CHANNEL_KEYS[ch_hash]:
+    for ch_name, key in named:
         try:
-            cipher = AES.new(key, AES.MODE_ECB)
-            plaintext = cipher.decrypt(ciphertext)
+            plaintext = _aes_ecb_decrypt(key, ciphertext)
 
             if len(plaintext) < 6:
                 continue
             text = plaintext[5:].rstrip(b'\x00').decode('utf-8', errors='ignore').strip()
 
-            if text and sum(c.isprintable() for c in text) > len(text) // 2:
-                return {'channel': ch_name, 'hash': f"{ch_hash:02X}", 'text': text}
+            if text and _mostly_printable(text):
+                return {'channel': ch_name, 'hash': _HEX_BYTE[ch_hash], 'text': text}
         except Exception:
             continue
 
     return None
 
 
+def _payload_info_grp(payload):
+    """GRP_TXT (5) / GRP_DATA (6): пытаемся расшифровать, иначе показываем хеш канала."""
+    decrypted = decrypt_group_msg(payload)
+    if decrypted:
+        return f"Канал: {decrypted['channel']} | {decrypted['text']}"
+    channel_hash = _HEX_BYTE[payload[0]]
+    return f"Канал: {channel_hash} (текст зашифрован)"
+
+
+_ADVERT_NODE_TYPES = {0x01: 'Chat', 0x02: 'Repeater', 0x03: 'Room Server', 0x04: 'Sensor'}
+# Смещение имени в appdata ADVERT по байту flags: 1 (flags) + lat/long (0x10, 8 байт)
+# + feature 1 (0x20, 2 байта) + feature 2 (0x40, 2 байта).
+_ADVERT_NAME_OFFSET = tuple(
+    1 + (8 if f & 0x10 else 0) + (2 if f & 0x20 else 0) + (2 if f & 0x40 else 0)
+    for f in range(256)
+)
+
+
+def _payload_info_advert(payload):
+    """ADVERT (4): pubkey(32) + timestamp(4) + signature(64) + appdata."""
+    if len(payload) <= 100:
+        return ""
+    appdata = payload[100:]
+    flags = appdata[0]
+    node_type = _ADVERT_NODE_TYPES.get(flags & 0x0F, f'?{flags & 0x0F:02X}')
+    result = f"Тип: {node_type}"
+    # Имя — последнее поле appdata, после lat/long/features
+    if flags & 0x80:
+        offset = _ADVERT_NAME_OFFSET[flags]
+        if offset < len(appdata):
+            name = appdata[offset:].decode('utf-8', errors='ignore').strip()
+            if name:
+                result += f", Имя: {name}"
+    return result
+
+
+def _payload_info_addr(payload):
+    """REQ/RESPONSE/TXT_MSG/ACK и др.: dst/src hash."""
+    if len(payload) < 2:
+        return ""
+    return f"[{_HEX_BYTE[payload[1]]}->{_HEX_BYTE[payload[0]]}]"
+
+
+# payload_type -> функция описания payload для decode_payload_info
+_PAYLOAD_INFO = {
+    0x00: _payload_info_addr,
+    0x01: _payload_info_addr,
+    0x02: _payload_info_addr,
+    0x04: _payload_info_advert,
+    0x05: _payload_info_grp,
+    0x06: _payload_info_grp,
+    0x08: _payload_info_addr,
+}
+
+
 def decode_payload_info(payload_type, payload):
     """Извлекает доступную информацию из payload пакета.
 
@@ -1880,84 +2386,44 @@ def decode_payload_info(payload_type, payload):
     """
     if not payload:
         return ""
-
-    # GRP_TXT (5) / GRP_DATA (6): пытаемся расшифровать, иначе показываем хеш канала
-    if payload_type in (0x05, 0x06):
-        decrypted = decrypt_group_msg(payload)
-        if decrypted:
-            return f"Канал: {decrypted['channel']} | {decrypted['text']}"
-        channel_hash = f"{payload[0]:02X}"
-        return f"Канал: {channel_hash} (текст зашифрован)"
-
-    # ADVERT (4): pubkey(32) + timestamp(4) + signature(64) + appdata
-    if payload_type == 0x04 and len(payload) > 100:
-        appdata = payload[100:]
-        if appdata:
-            flags = appdata[0]
-            node_type_map = {0x01: 'Chat', 0x02: 'Repeater', 0x03: 'Room Server', 0x04: 'Sensor'}
-            node_type = node_type_map.get(flags & 0x0F, f'?{flags & 0x0F:02X}')
-            # Пропускаем опциональные поля, ищем имя в конце appdata
-            name = ""
-            if flags & 0x80:
-                # Имя — последнее поле appdata, после lat/long/features
-                offset = 1
-                if flags & 0x10:
-                    offset += 8  # lat + long
-                if flags & 0x20:
-                    offset += 2  # feature 1
-                if flags & 0x40:
-                    offset += 2  # feature 2
-                if offset < len(appdata):
-                    try:
-                        name = appdata[offset:].decode('utf-8', errors='ignore').strip()
-                    except Exception:
-                        pass
-            result = f"Тип: {node_type}"
-            if name:
-                result += f", Имя: {name}"
-            return result
-
-    # REQ/RESPONSE/TXT_MSG/ACK и др.: dst/src hash
-    if payload_type in (0x00, 0x01, 0x02, 0x08) and len(payload) >= 2:
-        dst_hash = f"{payload[0]:02X}"
-        src_hash = f"{payload[1]:02X}"
-        return f"[{src_hash}->{dst_hash}]"
-
-    return ""
+    decoder = _PAYLOAD_INFO.get(payload_type)
+    return decoder(payload) if decoder else ""
 
 
 def print_max_hops(cycle_info):
     """Выводит информацию о пакете с максимальным числом хопов."""
-    print("\n" + "=" * 70)
-    print(f"РЕКОРД ХОПОВ (цикл {cycle_info['num']})")
-    print("=" * 70)
+    out = []  # строки таблицы: выводятся одной записью в конце
+    out.append("\n" + "=" * 70)
+    out.append(f"РЕКОРД ХОПОВ (цикл {cycle_info['num']})")
+    out.append("=" * 70)
 
     def _print_record(title, r):
         if not r:
-            print(f"  {title}: нет данных")
+            out.append(f"  {title}: нет данных")
             return
         path_str = ','.join(r['path']) if r.get('path') else '-'
         pkt_label = f"{r.get('route_name', '?')} {r.get('payload_name', '?')}"
         payload_info = decode_payload_info(r.get('payload_type', -1), r.get('payload', b''))
-        print(f"  {title}:")
-        print(f"    Время:  {r.get('time', '?')}")
-        print(f"    Тип:    {pkt_label}")
-        print(f"    Хопов:  {r.get('hops', 0)}")
+        out.append(f"  {title}:")
+        out.append(f"    Время:  {r.get('time', '?')}")
+        out.append(f"    Тип:    {pkt_label}")
+        out.append(f"    Хопов:  {r.get('hops', 0)}")
         bph = r.get('path_bytes_per_hop', 1)
         if bph == 2:
-            print(f"    Path:   [{BLUE}{BOLD}{path_str}{RESET}] {BLUE}{BOLD}[2B]{RESET}")
+            out.append(f"    Path:   [{BLUE}{BOLD}{path_str}{RESET}] {BLUE}{BOLD}[2B]{RESET}")
         elif bph == 3:
-            print(f"    Path:   [{MAGENTA}{BOLD}{path_str}{RESET}] {MAGENTA}{BOLD}[3B]{RESET}")
+            out.append(f"    Path:   [{MAGENTA}{BOLD}{path_str}{RESET}] {MAGENTA}{BOLD}[3B]{RESET}")
         else:
-            print(f"    Path:   [{path_str}]")
+            out.append(f"    Path:   [{path_str}]")
         if payload_info:
-            print(f"    Инфо:   {payload_info}")
+            out.append(f"    Инфо:   {payload_info}")
 
     _print_record("Рекорд (1B)", max_hops_by_bph.get(1))
     _print_record("Рекорд (2B)", max_hops_by_bph.get(2))
     _print_record("Рекорд (3B)", max_hops_by_bph.get(3))
 
-    print("=" * 70)
+    out.append("=" * 70)
+    _write_lines(out)
 
 
 def print_neighbors(cycle_info, debug=None):
@@ -1970,55 +2436,64 @@ def print_neighbors(cycle_info, debug=None):
         cycle_info: dict с данными цикла
         debug: dict с отладочными счётчиками (опционально)
     """
-    print("\n" + "=" * 78)
-    print(f"СОСЕДИ (цикл {cycle_info['num']})")
+    out = []  # строки таблицы: выводятся одной записью в конце
+    out.append("\n" + "=" * 78)
+    out.append(f"СОСЕДИ (цикл {cycle_info['num']})")
 
     if debug and debug.get('noise_floor_count'):
         avg_nf = debug['noise_floor_sum'] / debug['noise_floor_count']
-        print(f"Noise floor (среднее за цикл): {avg_nf:.1f} dBm  "
+        out.append(f"Noise floor (среднее за цикл): {avg_nf:.1f} dBm  "
               f"(n={debug['noise_floor_count']})")
 
-    print("=" * 78)
+    out.append("=" * 78)
 
     if not neighbor_stats:
-        print("  Нет данных о соседях")
-        print("=" * 78)
+        out.append("  Нет данных о соседях")
+        out.append("=" * 78)
+        _write_lines(out)
         return
 
-    sorted_neighbors = sorted(neighbor_stats.items(), key=lambda x: x[1]['total'], reverse=True)
-    grand_total = sum(d['total'] for d in neighbor_stats.values())
+    # Один проход: кортежи (total, сосед, запись) и общий итог; сортировка
+    # по готовому ключу через itemgetter, без lambda на каждое сравнение.
+    # Обходим копию: таблицу пополняют фоновые потоки.
+    sorted_neighbors = []
+    grand_total = 0
+    for node, data in list(neighbor_stats.items()):
+        sorted_neighbors.append((data.total, node, data))
+        grand_total += data.total
+    sorted_neighbors.sort(key=itemgetter(0), reverse=True)
 
-    print(f"{'Сосед':<8} {'Пакетов':>8} {'%':>6} {'Приём':>7} {'SNR→':>7} {'SNR←':>7} {'Trace':>7}")
-    print("-" * 78)
+    out.append(f"{'Сосед':<8} {'Пакетов':>8} {'%':>6} {'Приём':>7} {'SNR→':>7} {'SNR←':>7} {'Trace':>7}")
+    out.append("-" * 78)
 
-    for node, data in sorted_neighbors:
-        pct = data['total'] / grand_total * 100 if grand_total > 0 else 0
+    for total, node, data in sorted_neighbors:
+        pct = total / grand_total * 100 if grand_total > 0 else 0
 
         rx_snr = (
-            f"{data['snr_sum'] / data['snr_count']:.1f}"
-            if data.get('snr_count')
+            f"{data.snr_sum / data.snr_count:.1f}"
+            if data.snr_count
             else "-"
         )
-        snr_out = f"{data['trace_out_sum'] / data['trace_out_count']:.2f}" if data.get('trace_out_count') else "-"
-        snr_in = f"{data['trace_in_sum'] / data['trace_in_count']:.2f}" if data.get('trace_in_count') else "-"
-        attempts = data.get('trace_attempts', 0)
-        trace_col = f"{data.get('trace_ok', 0)}/{attempts}" if attempts else "-"
+        snr_out = f"{data.trace_out_sum / data.trace_out_count:.2f}" if data.trace_out_count else "-"
+        snr_in = f"{data.trace_in_sum / data.trace_in_count:.2f}" if data.trace_in_count else "-"
+        attempts = data.trace_attempts
+        trace_col = f"{data.trace_ok}/{attempts}" if attempts else "-"
 
         base_line = (
-            f"{node:<8} {data['total']:>8} {pct:>5.1f}% {rx_snr:>7} "
+            f"{node:<8} {total:>8} {pct:>5.1f}% {rx_snr:>7} "
             f"{snr_out:>7} {snr_in:>7} {trace_col:>7}"
         )
 
-        if is_my_repeater(node):
-            print(f"{CYAN}{base_line}{RESET}")
-        elif node.startswith(NODE_PREFIX):
-            print(f"{GREEN}{base_line}{RESET}")
+        color = _node_color(node)
+        if color:
+            out.append(f"{color}{base_line}{RESET}")
         else:
-            print(base_line)
+            out.append(base_line)
 
-    print("-" * 78)
-    print(f"Всего пакетов от соседей: {grand_total}")
-    print("=" * 78)
+    out.append("-" * 78)
+    out.append(f"Всего пакетов от соседей: {grand_total}")
+    out.append("=" * 78)
+    _write_lines(out)
 
 
 def print_outgoing_neighbors(cycle_info):
@@ -2032,35 +2507,96 @@ def print_outgoing_neighbors(cycle_info):
     Args:
         cycle_info: dict с данными цикла
     """
-    print("\n" + "=" * 70)
-    print(f"ИСХОДЯЩИЕ СОСЕДИ (цикл {cycle_info['num']})")
-    print("=" * 70)
+    out = []  # строки таблицы: выводятся одной записью в конце
+    out.append("\n" + "=" * 70)
+    out.append(f"ИСХОДЯЩИЕ СОСЕДИ (цикл {cycle_info['num']})")
+    out.append("=" * 70)
 
     if not outgoing_stats:
-        print("  Нет данных (ждём пакеты из API или расшифрованных сообщений с path)")
-        print("=" * 70)
+        out.append("  Нет данных (ждём пакеты из API или расшифрованных сообщений с path)")
+        out.append("=" * 70)
+        _write_lines(out)
         return
 
-    sorted_out = sorted(outgoing_stats.items(), key=lambda x: x[1]['total'], reverse=True)
-    grand_total = sum(d['total'] for d in outgoing_stats.values())
+    # most_common() сортирует живой Counter, а его пополняет поток опроса API:
+    # сортируем копию (тот же порядок, что у most_common).
+    sorted_out = sorted(list(outgoing_stats.items()), key=itemgetter(1), reverse=True)
+    grand_total = sum(n for _, n in sorted_out)
 
-    print(f"{'Сосед':<8} {'Пакетов':>8} {'%':>6}")
-    print("-" * 70)
+    out.append(f"{'Сосед':<8} {'Пакетов':>8} {'%':>6}")
+    out.append("-" * 70)
 
-    for node, data in sorted_out:
-        pct = data['total'] / grand_total * 100 if grand_total > 0 else 0
-        base_line = f"{node:<8} {data['total']:>8} {pct:>5.1f}%"
+    for node, total in sorted_out:
+        pct = total / grand_total * 100 if grand_total > 0 else 0
+        base_line = f"{node:<8} {total:>8} {pct:>5.1f}%"
 
-        if is_my_repeater(node):
-            print(f"{CYAN}{base_line}{RESET}")
-        elif node.upper().startswith(NODE_PREFIX.upper()):
-            print(f"{GREEN}{base_line}{RESET}")
+        color = _node_color(node)
+        if color:
+            out.append(f"{color}{base_line}{RESET}")
         else:
-            print(base_line)
+            out.append(base_line)
+
+    out.append("-" * 70)
+    out.append(f"Всего исходящих через соседей: {grand_total}")
+    out.append("=" * 70)
+    _write_lines(out)
+
+
+_api_conn = None  # HTTP(S)-соединение с MeshCoreTel, переиспользуется между опросами
+_api_conn_origin = None  # (схема, хост:порт), к которым открыто _api_conn
+
+
+def _api_http_get(url, redirects=1):
+    """GET по постоянному соединению (HTTP/1.1 keep-alive); возвращает тело ответа.
 
-    print("-" * 70)
-    print(f"Всего исходящих через соседей: {grand_total}")
-    print("=" * 70)
+    TCP/TLS-рукопожатие — один раз на соединение, а не на каждый опрос.
+    Если сервер закрыл простаивающее соединение, переподключается один раз.
+    Перенаправление (3xx с Location) выполняется не более redirects раз.
+    Если для адреса задан прокси (HTTP(S)_PROXY без исключения в NO_PROXY),
+    запрос идёт обычным urlopen: он ходит через прокси и сам следует
+    перенаправлениям. Вызывается только из потока _api_poller.
+    """
+    import http.client  # только для --api: не тянем ssl/http при каждом запуске
+    import urllib.parse
+    import urllib.request
+
+    global _api_conn, _api_conn_origin
+    parts = urllib.parse.urlsplit(url)
+    headers = {'User-Agent': 'meshcore-analyzer'}
+    if (parts.scheme in urllib.request.getproxies()
+            and not urllib.request.proxy_bypass(parts.hostname or '')):
+        req = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.read()
+
+    origin = (parts.scheme, parts.netloc)
+    if _api_conn is not None and _api_conn_origin != origin:
+        _api_conn.close()
+        _api_conn = None
+    target = parts.path + ('?' + parts.query if parts.query else '')
+    for attempt in range(2):
+        if _api_conn is None:
+            conn_cls = (http.client.HTTPSConnection if parts.scheme == 'https'
+                        else http.client.HTTPConnection)
+            _api_conn = conn_cls(parts.netloc, timeout=30)
+            _api_conn_origin = origin
+        try:
+            _api_conn.request('GET', target, headers=headers)
+            resp = _api_conn.getresponse()
+            body = resp.read()
+        except (http.client.HTTPException, OSError):
+            _api_conn.close()
+            _api_conn = None
+            if attempt:
+                raise
+            continue
+        if resp.status in (301, 302, 303, 307, 308) and redirects > 0:
+            location = resp.getheader('Location')
+            if location:
+                return _api_http_get(urllib.parse.urljoin(url, location), redirects - 1)
+        if resp.status != 200:
+            raise OSError(f"HTTP {resp.status} {resp.reason}")
+        return body
 
 
 def fetch_outgoing_from_api():
@@ -2076,83 +2612,93 @@ def fetch_outgoing_from_api():
     Returns:
         int: количество новых исходящих соседей, найденных в этом запросе
     """
-    global _api_last_id
+    global _api_last_id, _api_last_fetched
     found = 0
     total_fetched = 0
-    page_limit = 500
-    max_pages = 5
+    page_limit = API_PAGE_LIMIT
+    max_pages = API_MAX_PAGES
+    # Режимы вывода не меняются во время опроса: читаем глобальные один раз,
+    # в цикле по пакетам — только локальные проверки
+    verbose = VERBOSE
+    debug_mode = DEBUG_MODE
+    want_labels = verbose or debug_mode
+    # Соседи копятся локально и вливаются в общий outgoing_stats одним
+    # update() в конце опроса (его же читают основной поток и save_stats)
+    poll_totals = Counter()
 
     for page in range(max_pages):
         try:
             url = f'{MESHCORETEL_API}?limit={page_limit}'
             if _api_last_id is not None:
                 url += f'&since_id={_api_last_id}'
-            req = urllib.request.Request(url, headers={'User-Agent': 'meshcore-analyzer'})
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                packets = json.loads(resp.read())
+            packets = _json_loads(_api_http_get(url))
         except Exception:
-            if VERBOSE:
-                print(f"  {YELLOW}[API] таймаут, повтор через 15 сек{RESET}", flush=True)
+            if verbose:
+                print(f"  {YELLOW}[API] таймаут, повтор при следующем опросе{RESET}", flush=True)
             break
 
         if not packets:
             break
 
         total_fetched += len(packets)
-        min_id = min(p['id'] for p in packets)
         max_id = max(p['id'] for p in packets)
         if _api_last_id is None or max_id > _api_last_id:
             _api_last_id = max_id
 
         for pkt in packets:
             pkt_hash = pkt.get('hash', '')
-            if not pkt_hash or pkt_hash in _api_seen_hashes:
+            if not pkt_hash:
                 continue
-            _api_seen_hashes.add(pkt_hash)
-            if DEBUG_MODE:
+            if pkt_hash in _api_seen_hashes:
+                _api_seen_hashes.move_to_end(pkt_hash)
+                continue
+            _lru_add(_api_seen_hashes, pkt_hash, API_SEEN_MAX)
+            # Поля пакета читаем по одному разу
+            origin = pkt.get('origin', '?')
+            payload_type = pkt.get('payload_type', -1)
+            if debug_mode:
                 global _api_origins_seen
-                _api_origins_seen.add(pkt.get('origin', '?'))
+                _api_origins_seen.add(origin)
 
-            if pkt.get('payload_type') == 0x09:
+            if payload_type == 0x09:
                 continue
 
             hops = pkt.get('path_hops')
             if not hops:
                 continue
 
-            origin = pkt.get('origin', '?')
             # Сравнение USB vs API — по всем пакетам из API (MeshCoreTel отдаёт того, кто первым сообщил)
-            if pkt_hash:
-                _api_hashes_curr.add(pkt_hash)
+            _api_hashes_curr.add(pkt_hash)
 
-            is_my_observer = (OBSERVER_ORIGINS and
-                              any(origin.startswith(pref) for pref in OBSERVER_ORIGINS))
-            path_str = ' → '.join(hops)
-            if DEBUG_MODE:
+            if want_labels:
+                # Подписи пакета нужны только для вывода — собираем один раз на пакет
+                is_my_observer = (OBSERVER_ORIGINS and
+                                  any(origin.startswith(pref) for pref in OBSERVER_ORIGINS))
                 my_tag = " [мой observer]" if is_my_observer else ""
-                ptype = PAYLOAD_TYPES.get(pkt.get('payload_type', -1), '?')
+                ptype = PAYLOAD_TYPES.get(payload_type, '?')
+                path_str = ' → '.join(hops)
+            if debug_mode:
                 with open(DEBUG_LOG, 'a', encoding='utf-8') as f:
                     f.write(f"[API] {origin}{my_tag}: {ptype} [{path_str}]\n")
 
-            for i, hop in enumerate(hops):
+            # Регистр хопов нормализуем один раз на пакет, а не на каждом шаге
+            hops_u = [h.upper() for h in hops]
+            for i, hop in enumerate(hops_u):
                 if not is_my_repeater(hop):
                     continue
-                if i + 1 >= len(hops):
+                if i + 1 >= len(hops_u):
                     break
-                neighbor = hops[i + 1].upper()
+                neighbor = hops_u[i + 1]
                 if is_my_repeater(neighbor):
                     # Перекрёстная пересылка между нашими репитерами —
                     # не считаем соседом.
                     break
-                outgoing_stats[neighbor]['total'] += 1
+                poll_totals[neighbor] += 1
                 found += 1
-                path_str = ' → '.join(hops)
-                ptype = PAYLOAD_TYPES.get(pkt.get('payload_type', -1), '?')
-                my_tag = " [мой observer]" if is_my_observer else ""
-                if VERBOSE:
+                if verbose:
                     print(f"  {CYAN}[API] {origin}{my_tag}: {ptype} "
                           f"[{path_str}] → сосед {BOLD}{neighbor}{RESET}", flush=True)
-                if DEBUG_MODE:
+                if debug_mode:
                     with open(DEBUG_LOG, 'a', encoding='utf-8') as f:
                         f.write(f"[API] {origin}{my_tag}: {ptype} [{path_str}] → сосед {neighbor}\n")
                 break
@@ -2160,9 +2706,9 @@ def fetch_outgoing_from_api():
         if len(packets) < page_limit:
             break
 
-    if len(_api_seen_hashes) > 50000:
-        _api_seen_hashes.clear()
-
+    if poll_totals:
+        outgoing_stats.update(poll_totals)
+    _api_last_fetched = total_fetched
     return found
 
 
@@ -2172,15 +2718,23 @@ def _api_poller(stop_event):
     Работает независимо от состояния USB-порта: даже при потере Observer
     продолжает обновлять outgoing_stats через MeshCoreTel.
     Адреса репитеров берутся из глобального MY_REPEATERS_HEX.
+
+    Интервал адаптивный: пустой ответ (или ошибка) — реже, до API_POLL_MAX;
+    выбраны все страницы (пакеты остались) — чаще, до API_POLL_MIN;
+    иначе плавно (EWMA) возвращаемся к API_POLL_INTERVAL.
     """
-    poll_interval = 15
+    poll_interval = API_POLL_INTERVAL
     while not stop_event.is_set():
         fetch_outgoing_from_api()
-        # Спим интервал, но проверяем stop_event каждую секунду
-        for _ in range(poll_interval):
-            if stop_event.is_set():
-                return
-            time.sleep(1)
+        if _api_last_fetched == 0:
+            poll_interval = min(API_POLL_MAX, poll_interval * 1.5)
+        elif _api_last_fetched >= API_PAGE_LIMIT * API_MAX_PAGES:
+            poll_interval = max(API_POLL_MIN, poll_interval * 0.5)
+        else:
+            poll_interval += (API_POLL_INTERVAL - poll_interval) * 0.3
+        # Спим интервал одним ожиданием; stop_event будит сразу
+        if stop_event.wait(poll_interval):
+            return
 
 
 def _apply_mqtt_cli(args):
@@ -2207,6 +2761,8 @@ def _mqtt_thread(stop_event):
     """Фоновый поток: подписка на MQTT MeshCoreTel, обработка входящих сообщений."""
     if not HAS_MQTT:
         return
+    import paho.mqtt.client as mqtt
+
     transport = "websockets" if MQTT_USE_WEBSOCKETS else "tcp"
     port = MQTT_PORT_WS if MQTT_USE_WEBSOCKETS else MQTT_PORT
     try:
@@ -2286,8 +2842,7 @@ def _mqtt_thread(stop_event):
 
     try:
         client.loop_start()
-        while not stop_event.wait(timeout=1):
-            pass
+        stop_event.wait()  # сообщения обрабатывает поток paho; ждём только остановки
     except Exception as e:
         print(f"{YELLOW}[MQTT] ошибка MQTT-потока: {e}{RESET}", flush=True)
     finally:
@@ -2298,35 +2853,97 @@ def _mqtt_thread(stop_event):
             pass
 
 
-def _serial_reader(ser, line_queue, stop_event, error_event):
+# Предел очереди строк от потока чтения порта: при долгой остановке разбора
+# (вывод таблиц, запись статистики) теряются самые старые строки, а не память.
+LINE_QUEUE_MAX = 8192
+# Сколько строк вытеснено из переполненной очереди (пишет только _serial_reader)
+_line_queue_dropped = 0
+
+# Размер приёмного буфера драйвера COM-порта (только Windows: по умолчанию
+# 4 КБ, всплеск лога при выводе статистики может его переполнить).
+SERIAL_RX_BUFFER = 65536
+
+
+def _serial_reader(ser, line_queue, data_event, stop_event, error_event):
     """Фоновый поток: непрерывно читает серийный порт и кладёт строки в очередь.
 
+    line_queue — deque(maxlen=LINE_QUEUE_MAX) из строк-bytes (один писатель,
+    один читатель; append/popleft атомарны под GIL), data_event будит
+    основной поток.
+
     Работает даже во время вывода статистики, чтобы не терять пакеты
     из-за переполнения буфера серийного порта.
     При ошибке порта устанавливает error_event для уведомления основного потока.
+
+    Забирает из порта всё накопленное одним read() и режет на строки сам:
+    readline() в pyserial читает по одному байту.
     """
+    # read() блокируется в драйвере до первого байта (не дольше таймаута) и
+    # возвращается сразу по приходу данных; таймаут нужен только для проверки
+    # stop_event — 0.1 сек, как и ожидание data_event в основном цикле.
+    global _line_queue_dropped
+    ser.timeout = 0.1
+    queue_max = line_queue.maxlen
+    buf = b''
     while not stop_event.is_set():
         try:
-            if ser.in_waiting:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                if line:
-                    line_queue.put(line)
-            else:
-                time.sleep(0.02)
+            chunk = ser.read(ser.in_waiting or 1)
+            if not chunk:
+                continue
+            buf += chunk
+            if b'\n' not in chunk:
+                continue  # строка ещё не дописана — копим без лишнего split()
+            *lines, buf = buf.split(b'\n')
+            for raw in lines:
+                # Декодирует уже parse_line(): служебные строки так и остаются bytes
+                raw = raw.strip()
+                if raw:
+                    if len(line_queue) == queue_max:
+                        _line_queue_dropped += 1  # append вытеснит самую старую строку
+                    line_queue.append(raw)
+            if lines:
+                data_event.set()
         except Exception:
             error_event.set()
             break
 
 
 RECONNECT_INTERVAL = 5  # секунд между попытками переподключения
+UDEV_RECHECK_INTERVAL = 60  # страховочная проверка порта при ожидании через udev
 
 
 def _wait_for_port(port):
-    """Ожидает появления серийного порта, проверяя каждые RECONNECT_INTERVAL сек."""
-    while True:
-        if os.path.exists(port):
-            return
-        time.sleep(RECONNECT_INTERVAL)
+    """Ожидает появления серийного порта.
+
+    С pyudev просыпается по событию udev 'add' для tty (порт появляется сразу),
+    проверка раз в UDEV_RECHECK_INTERVAL сек остаётся страховкой. Без pyudev —
+    проверка каждые RECONNECT_INTERVAL сек.
+    """
+    if os.path.exists(port):
+        return
+    observer = None
+    interval = RECONNECT_INTERVAL
+    port_event = threading.Event()
+    if HAS_PYUDEV:
+        try:
+            import pyudev
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by('tty')
+            # Имя порта может быть симлинком (/dev/serial/by-id/...) — будим на
+            # любое добавление tty, а существование проверяем ниже.
+            observer = pyudev.MonitorObserver(
+                monitor, callback=lambda d: port_event.set() if d.action == 'add' else None)
+            observer.start()
+            interval = UDEV_RECHECK_INTERVAL
+        except Exception:
+            observer = None
+    try:
+        while not os.path.exists(port):
+            port_event.wait(interval)
+            port_event.clear()
+    finally:
+        if observer is not None:
+            observer.stop()
 
 
 def _connect_and_run(args, port, cycle_counter):
@@ -2340,33 +2957,41 @@ def _connect_and_run(args, port, cycle_counter):
     reader_thread = None
     try:
         ser = serial.Serial(port, BAUDRATE, timeout=1)
+        if hasattr(ser, 'set_buffer_size'):  # есть только у serialwin32
+            ser.set_buffer_size(rx_size=SERIAL_RX_BUFFER)
         print(f"\nПодключён к {port}")
         print(f"Цикл статистики: каждые {CYCLE_TIME} сек")
         if HAS_CRYPTO:
             _ch_disp = ['Public (PSK MeshCore)'] + list(KNOWN_CHANNEL_NAMES)
             print(f"Дешифрование каналов: {', '.join(_ch_disp)}")
         else:
-            print(f"{YELLOW}pycryptodome не установлен — расшифровка каналов отключена{RESET}")
+            print(f"{YELLOW}cryptography/pycryptodome не установлены — расшифровка каналов отключена{RESET}")
         if args.api:
             print(f"API meshcoretel.ru: исходящие соседи для адресов {','.join(MY_REPEATERS_HEX)}")
         if DEBUG_MODE:
             print(f"Отладка ->OBS: пакеты пишутся в {DEBUG_LOG}")
         print(flush=True)
-        time.sleep(2)
 
-        send_cmd(ser, "log start")
-        time.sleep(1)
-        # Диагностика: проверяем, отвечает ли порт
+        # Проба готовности вместо пауз 2+1 сек: "log start" до ответа ноды
+        first_line = start_logging(ser)
+        if not first_line:
+            print(f"{YELLOW}Нода не ответила на \"log start\" "
+                  f"(попыток: {READY_ATTEMPTS}) — продолжаем ждать лог{RESET}", flush=True)
         waiting = ser.in_waiting
-        test_line = ser.readline().decode('utf-8', errors='ignore').strip() if waiting else ''
+        test_line = first_line.decode('utf-8', errors='ignore')
         print(f"Логирование включено (буфер: {waiting} байт, ответ: '{test_line}')", flush=True)
 
-        line_queue = queue.Queue()
+        line_queue = deque(maxlen=LINE_QUEUE_MAX)
+        if first_line:
+            # Это может быть уже строка лога — эхо команды parse_line отфильтрует
+            line_queue.append(first_line)
+        data_event = threading.Event()
         reader_thread = threading.Thread(
-            target=_serial_reader, args=(ser, line_queue, stop_event, error_event),
+            target=_serial_reader, args=(ser, line_queue, data_event, stop_event, error_event),
             daemon=True
         )
         reader_thread.start()
+        dropped_reported = _line_queue_dropped
 
         while True:
             cycle_counter[0] += 1
@@ -2379,27 +3004,44 @@ def _connect_and_run(args, port, cycle_counter):
             }
 
             lines_read = 0
-            cycle_start = time.time()
+            cycle_start = time.monotonic()
 
-            last_data_time = time.time()
-            while time.time() - cycle_start < CYCLE_TIME:
+            last_data_time = time.monotonic()
+            while time.monotonic() - cycle_start < CYCLE_TIME:
                 if error_event.is_set():
                     raise serial.SerialException("Устройство отключено")
-                try:
-                    line = line_queue.get(timeout=0.1)
-                    lines_read += 1
-                    last_data_time = time.time()
-                    parse_line(line, stats, debug)
-                except queue.Empty:
-                    if time.time() - last_data_time > 1800:
+                if line_queue:
+                    last_data_time = time.monotonic()
+                    # Разбираем только то, что уже накоплено: при непрерывном потоке
+                    # цикл всё равно закончится вовремя.
+                    for _ in range(len(line_queue)):
+                        lines_read += 1
+                        parse_line(line_queue.popleft(), stats, debug)
+                    if VERBOSE:
+                        # Вывод пачки строк — одной записью, а не flush на каждую
+                        sys.stdout.flush()
+                else:
+                    data_event.wait(0.1)
+                    data_event.clear()
+                    if line_queue:
+                        continue
+                    if time.monotonic() - last_data_time > 1800:
                         try:
                             ser.write(b"log start\r\n")
                         except (serial.SerialException, OSError):
                             raise serial.SerialException("Порт отключён")
-                        last_data_time = time.time()
+                        last_data_time = time.monotonic()
                         if VERBOSE:
                             print(f"  {YELLOW}[!] нет данных 30 мин, переотправка log start{RESET}", flush=True)
 
+            # Потери из-за переполнения очереди видны сразу, а не молча
+            dropped = _line_queue_dropped - dropped_reported
+            if dropped:
+                dropped_reported += dropped
+                print(f"{YELLOW}[!] Очередь строк переполнена: потеряно {dropped} строк "
+                      f"(разбор не успевает за портом){RESET}", flush=True)
+
+            prune_stats()
             cycle_info = {
                 'num': cycle_counter[0],
                 'lines_read': lines_read,
@@ -2533,6 +3175,7 @@ def main(args):
         while True:
             cycle_counter[0] += 1
             time.sleep(CYCLE_TIME)
+            prune_stats()
             cycle_info = {
                 'num': cycle_counter[0],
                 'lines_read': 0,
@@ -2578,8 +3221,8 @@ def main(args):
 
     except KeyboardInterrupt:
         print("\n\nОстановлено пользователем")
-        total_rx = sum(d['rx'] for d in stats.values())
-        total_tx = sum(d['tx'] for d in stats.values())
+        total_rx = sum(d.rx for d in stats.values())
+        total_tx = sum(d.tx for d in stats.values())
         last_cycle_num = cycle_counter[0] if 'cycle_counter' in locals() else 0
         cycle_info = {
             'num': 'ИТОГО',
@@ -2596,7 +3239,7 @@ def main(args):
             print_outgoing_neighbors(cycle_info)
         if args.hops:
             print_max_hops(cycle_info)
-        save_stats()
+        save_stats(sync=True)
     finally:
         if mqtt_stop_event is not None:
             mqtt_stop_event.set()
@@ -2662,15 +3305,22 @@ if __name__ == "__main__":
                         help='TCP вместо WebSockets (локальный Mosquitto, как set mqtt.port 1883)')
     parser.add_argument('--mqtt-username', default=None, help='Логин MQTT (по умолчанию из констант)')
     parser.add_argument('--mqtt-password', default=None, help='Пароль MQTT')
+    parser.add_argument('--max-nodes', type=int, default=MAX_NODES, metavar='N',
+                        help='Предел узлов и соседей в статистике: сверх него '
+                             'вытесняются наименее активные (0 — без предела, '
+                             f'по умолчанию {MAX_NODES})')
     parser.add_argument('--reset', action='store_true',
                         help='Сбросить сохранённую статистику и начать с нуля')
     args = parser.parse_args()
     VERBOSE = args.verbose
     BOTS_MODE = args.bots
     DEBUG_MODE = args.debug
+    MAX_NODES = args.max_nodes
     # Применяем CLI-список репитеров поверх дефолта в MY_REPEATERS_HEX.
     if args.repeaters:
         MY_REPEATERS_HEX = [r.strip().upper() for r in args.repeaters.split(',') if r.strip()]
+        _rebuild_repeater_prefixes()
+        _node_color.cache_clear()
     # Если ни один режим вывода не указан, показываем оригинальную статистику
     if not args.original and not args.neighbors and not args.hops:
         args.original = True
@@ -0,0 +1,64 @@
+"""Тесты загрузки и урезания статистики (meshcore-analyzer.py)."""
+
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'meshcore-analyzer.py')
+
+
+def _load_module():
+    spec = importlib.util.spec_from_file_location('meshcore_analyzer', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@unittest.skipIf(importlib.util.find_spec('serial') is None, 'нужен pyserial')
+class LoadStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.m = _load_module()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.m.STATS_FILE = os.path.join(self.tmp.name, 'meshcore-stats.json')
+        self.m.stats.clear()
+        self.m.neighbor_stats.clear()
+        self.m.outgoing_stats.clear()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write_stats_file(self, n):
+        data = {
+            'stats': {f'{i:06X}': {'rx': 1} for i in range(n)},
+            'neighbor_stats': {f'{i:04X}': {'total': 1} for i in range(n)},
+            'outgoing_stats': {},
+            'max_hops_by_bph': {},
+        }
+        with open(self.m.STATS_FILE, 'w') as f:
+            json.dump(data, f)
+
+    def test_load_with_default_limit_keeps_every_node(self):
+        # Больше прежнего предела 4096: по умолчанию ничего не вытесняется
+        self._write_stats_file(5000)
+        self.assertEqual(self.m.MAX_NODES, 0)
+        self.m.load_stats()
+        self.assertEqual(len(self.m.stats), 5000)
+        self.assertEqual(len(self.m.neighbor_stats), 5000)
+        self.m.prune_stats()
+        self.assertEqual(len(self.m.stats), 5000)
+        self.assertEqual(len(self.m.neighbor_stats), 5000)
+
+    def test_prune_with_limit_evicts_least_active(self):
+        self.m.MAX_NODES = 3  # вместе со строкой BCAST
+        for node, rx in (('AA', 5), ('BB', 1), ('CC', 3)):
+            self.m.stats[node].rx = rx
+        self.m.stats[self.m.BROADCAST_NODE].rx = 0
+        self.m.prune_stats()
+        self.assertEqual(set(self.m.stats), {'AA', 'CC', self.m.BROADCAST_NODE})
+
+
+if __name__ == '__main__':
+    unittest.main()